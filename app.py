@@ -1,31 +1,120 @@
-from flask import Flask, request, jsonify
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, Response, request, jsonify, stream_with_context, g
 from flask_cors import CORS
+import io
 import os
-from datetime import datetime
+import json
+import click
+import uuid
+import base64
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, Future
+from sqlalchemy import text, func, or_, and_, select, Select
+from itsdangerous import URLSafeTimedSerializer, BadData
 
 from config import Config
-from models import db, Material
-from utils.cloud_storage import CloudStorage
-from utils.doubao_ai_generator import DoubaoAIGenerator  # 导入豆包生成器
+from models import db, Material, KeywordJob, MaterialKeyword, DataVersion, SweepRun, MaterialStat, KeywordStat, split_keywords, MATERIAL_FIELDS, material_row_to_dict
+from utils.keyword_jobs import KeywordJobQueue
+from utils.keyword_sweeper import KeywordSweeper
+from utils.response_cache import ResponseCache
+from utils.image_derivatives import DerivativeGenerator
+from utils.metrics import metrics, instrument_sqlalchemy
+from utils.fast_json import FastJSONProvider, dumps as fast_dumps
+from utils.lazy_service import LazyService
+from utils.db_routing import route_request, pin_after_write, replica_binds, PIN_HEADER
+from utils.ingest import IngestStream
+from utils.orphan_gc import OrphanCollector
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.config.from_object(Config)
-CORS(app)
+# 跨域前端需要读取读己之写的响应头，并在之后的读请求中带回
+CORS(app, expose_headers=[PIN_HEADER])
 
 db.init_app(app)
+instrument_sqlalchemy(metrics)
+
+# 初始化服务：首次使用时才创建（SDK 也在此时导入），失败后按 SERVICE_RETRY_INTERVAL 重试
+def _create_cloud_storage():
+    from utils.cloud_storage import CloudStorage
+    return CloudStorage()
+
+def _create_ai_generator():
+    from utils.doubao_ai_generator import DoubaoAIGenerator  # 导入豆包生成器
+    return DoubaoAIGenerator()  # 使用豆包AI生成器
+
+cloud_storage = LazyService('cloud_storage', _create_cloud_storage)
+ai_generator = LazyService('ai_generator', _create_ai_generator)
+
+def _analyze_material(material, bypass_cache=False, model=None):
+    """调用豆包大模型为素材生成关键词（bypass_cache=True 时跳过结果缓存）
+
+    model 缺省时使用默认模型；结果及状态通过 record_analysis 记录到素材上，并返回该结果
+    """
+    if ai_generator:
+        model = model or ai_generator.model
+        if material.file_type == 'image':
+            # 有分析用小图时优先发送小图，减少大模型的耗时和 token 消耗
+            ai_result = ai_generator.generate_keywords_from_image_url(
+                material.analysis_url or material.file_path,
+                content_hash=material.content_hash, bypass_cache=bypass_cache, model=model)
+        else:
+            ai_result = ai_generator.generate_keywords_from_video(
+                material.file_path, content_hash=material.content_hash, bypass_cache=bypass_cache, model=model)
+        
+        material.record_analysis(ai_result, model)
+    else:
+        # 豆包客户端不可用，没有调用大模型
+        ai_result = {'success': False, 'ai_keywords': '鹰嘴蜜桃，优质农产品，溯源素材', 'attempted': False}
+        material.record_analysis(ai_result)
+    return ai_result
+
+# 图片衍生文件生成（进程池）
+derivative_generator = DerivativeGenerator()
+
+# 读接口响应缓存（数据版本号变化后 ETag 随之变化）
+response_cache = ResponseCache(DataVersion.current)
+
+# 异步关键词生成队列（AI_ASYNC_MODE 开启时使用）
+job_queue = KeywordJobQueue(app, _analyze_material)
 
-# 初始化服务
-try:
-    cloud_storage = CloudStorage()
-    ai_generator = DoubaoAIGenerator()  # 使用豆包AI生成器
-    storage_available = True
-except Exception as e:
-    print(f"服务初始化失败: {e}")
-    storage_available = False
-    cloud_storage = None
-    ai_generator = None
+# 关键词补跑（备用关键词、旧模型结果的重新分析）
+keyword_sweeper = KeywordSweeper(app, lambda materials, model: _generate_keywords(materials, model))
+
+@app.before_request
+def _start_embedded_workers():
+    if Config.AI_EMBEDDED_WORKERS:
+        if Config.AI_ASYNC_MODE:
+            job_queue.ensure_started()
+        keyword_sweeper.ensure_started()
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def _route_database():
+    route_request(request)
+
+@app.after_request
+def _pin_primary_after_write(response):
+    return pin_after_write(request, response)
+
+@app.after_request
+def _record_request_time(response):
+    # 流式响应在响应体发送前就会经过这里，只统计到首字节的耗时
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.observe('suyuan_request_seconds', time.perf_counter() - started,
+                        endpoint=request.endpoint or 'unmatched', method=request.method,
+                        status=response.status_code)
+    return response
 
 @app.route('/api/materials/<material_id>', methods=['GET'])
+@response_cache.cached
 def get_material(material_id):
     """获取单个素材详情"""
     try:
@@ -41,66 +130,358 @@ def get_material(material_id):
     except Exception as e:
         return jsonify({'error': f'查询失败: {str(e)}'}), 500
 
+VIDEO_EXTENSIONS = ['.mp4', '.mov', '.avi']
+
+def _file_type_of(filename):
+    """按扩展名判断素材类型（只用于客户端直传：文件内容不经过本服务，其余上传按文件头识别）"""
+    file_ext = os.path.splitext(filename)[1].lower()
+    return file_ext, 'video' if file_ext in VIDEO_EXTENSIONS else 'image'
+
+def _max_size_of(file_type):
+    """按文件类型返回大小上限"""
+    return Config.MAX_VIDEO_SIZE if file_type == 'video' else Config.MAX_IMAGE_SIZE
+
+def _is_file_shared(material, excluded_ids):
+    """云端文件是否仍被其他素材引用（去重后多条记录共用同一个COS对象）"""
+    if not material.content_hash:
+        return False
+    
+    return db.session.query(Material.id).filter(
+        Material.content_hash == material.content_hash,
+        Material.file_path == material.file_path,
+        ~Material.id.in_(excluded_ids)
+    ).first() is not None
+
+def _find_duplicate(content_hash):
+    """查找内容相同的最早一条素材"""
+    return Material.query.filter_by(content_hash=content_hash)\
+        .order_by(Material.upload_time).first()
+
+class _RequestContents:
+    """一次上传请求中已出现的内容：内容哈希 -> 第一个该内容文件的素材（上传完成前为未完成的 Future）
+
+    同一请求里重复的文件不会被 _find_duplicate 发现（第一个文件尚未入库），
+    需要先在这里判重，等第一个文件上传完成后复用它的云端文件。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._materials = {}
+
+    def claim(self, content_hash):
+        """返回 (future, owner)：owner 为 True 时由调用方上传该内容，并在结束后 set_result"""
+        with self._lock:
+            future = self._materials.get(content_hash)
+            if future is not None:
+                return future, False
+            future = self._materials[content_hash] = Future()
+            return future, True
+
+def _release_db_connection():
+    """结束当前只读事务并把连接还给连接池，避免在等待 COS、豆包时占着连接
+
+    已查询出的对象仍可读取已加载的字段，之后再访问数据库会自动获取新连接。
+    """
+    db.session.close()
+
+DERIVATIVE_FIELDS = ('analysis_url', 'thumbnail_url', 'web_url')
+
+def _upload_derivatives(data, filename):
+    """用原图数据生成衍生文件并上传到原文件旁边，返回 {字段名: URL}"""
+    with metrics.timer('suyuan_stage_seconds', stage='derivatives'):
+        renditions = derivative_generator.generate(data)
+    stem = os.path.splitext(filename)[0]
+    derivatives = {}
+    for name, (extension, body) in renditions.items():
+        content_type = 'image/webp' if extension == '.webp' else 'image/jpeg'
+        try:
+            derivatives[f'{name}_url'] = cloud_storage.upload_bytes(f"{stem}_{name}{extension}", body, content_type)
+        except Exception as e:
+            print(f"⚠️ 衍生文件上传失败: {e}")
+    return derivatives
+
+def _new_material(filename, file_type, file_path, file_size, content_hash, duplicate=None, derivatives=None):
+    """创建素材记录（重复内容直接复用已有关键词和衍生文件）
+
+    同步模式下需要生成关键词的素材 ai_keywords 为 None，由 _analyze_materials 统一补全
+    """
+    if duplicate:
+        derivatives = {field: getattr(duplicate, field) for field in DERIVATIVE_FIELDS}
+    
+    # 创建记录（移除了 location 和 activity_type）
+    material = Material(
+        filename=filename,
+        file_type=file_type,
+        file_path=file_path,
+        file_size=file_size,
+        content_hash=content_hash,
+        **(derivatives or {})
+        # 移除了 location 和 activity_type
+    )
+    
+    if duplicate and duplicate.ai_status == 'done':
+        material.ai_keywords = duplicate.ai_keywords
+        material.ai_model = duplicate.ai_model
+        material.ai_updated_at = duplicate.ai_updated_at
+    elif Config.AI_ASYNC_MODE:
+        # 异步模式：先入库，关键词由后台工作线程补全
+        material.ai_status = 'pending'
+        material.ai_keywords = ''
+    
+    return material
+
+def _with_app_context(func, *args):
+    with app.app_context():
+        return func(*args)
+
+def _analyze_materials(materials):
+    """为一批新上传的素材生成关键词（跳过已复用关键词或等待异步处理的素材）
+
+    同一请求中内容相同的素材只分析一次，其余的复制分析结果
+    """
+    pending = [material for material in materials if material.ai_keywords is None]
+    firsts = {}
+    for material in pending:
+        firsts.setdefault(material.content_hash or material.id, material)
+    _generate_keywords(list(firsts.values()))
+    
+    for material in pending:
+        first = firsts[material.content_hash or material.id]
+        if first is not material:
+            for field in ('ai_keywords', 'ai_status', 'ai_model', 'ai_attempts', 'ai_updated_at'):
+                setattr(material, field, getattr(first, field))
+
+def _generate_keywords(materials, model=None):
+    """为一批素材生成关键词（model 缺省时使用默认模型）
+
+    图片每 AI_BATCH_SIZE 张打包成一次大模型请求，视频逐个分析；
+    各批次和视频在线程池中并发执行。返回没有调用大模型就使用了备用关键词的素材
+    （客户端不可用、熔断、排队超时），补跑据此判断这一批是否需要稍后重试。
+    """
+    if not materials:
+        return []
+    if not ai_generator:
+        for material in materials:
+            _analyze_material(material)
+        return list(materials)
+    
+    model = model or ai_generator.model
+    images = [material for material in materials if material.file_type == 'image']
+    videos = [material for material in materials if material.file_type != 'image']
+    batches = [images[start:start + Config.AI_BATCH_SIZE]
+               for start in range(0, len(images), Config.AI_BATCH_SIZE)]
+    
+    workers = max(1, min(Config.UPLOAD_CONCURRENCY, len(batches) + len(videos)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (batch, executor.submit(
+                _with_app_context,
+                ai_generator.generate_keywords_batch,
+                [(material.analysis_url or material.file_path, material.content_hash) for material in batch],
+                None, model
+            ))
+            for batch in batches
+        ]
+        video_futures = [executor.submit(_with_app_context, _analyze_material, video, False, model)
+                         for video in videos]
+        
+        skipped = []
+        for batch, future in futures:
+            for material, ai_result in zip(batch, future.result()):
+                material.record_analysis(ai_result, model)
+                if not ai_result.get('attempted', True):
+                    skipped.append(material)
+        for video, future in zip(videos, video_futures):
+            if not future.result().get('attempted', True):
+                skipped.append(video)
+    return skipped
+
+def _save_materials(materials):
+    """在同一个事务中写入素材记录（异步模式下同时创建关键词任务），返回响应数据"""
+    saved = []
+    has_pending = False
+    
+    for material in materials:
+        db.session.add(material)
+        db.session.flush()
+        
+        if material.ai_status == 'pending':
+            job = job_queue.enqueue(material.id)
+            saved.append(dict(material.to_dict(), job_id=job.id))
+            has_pending = True
+        else:
+            material.sync_keyword_index()
+            saved.append(material.to_dict())
+    
+    if materials:
+        DataVersion.bump()
+    db.session.commit()
+    
+    if has_pending:
+        job_queue.notify()
+    
+    return saved
+
+def _ingest_file(file, contents):
+    """上传单个文件到云端，返回 (未入库的素材对象, 错误信息)（在线程池中执行）
+
+    类型按文件头识别而不是扩展名。表单文件已落盘可 seek：先按固定大小的缓冲区读一遍计算哈希和大小，
+    内容重复时（包括同一请求中的其他文件）直接复用已有的云端文件和关键词，不再上传；图片（有大小上限）在这一遍中同时保留数据，
+    上传和生成衍生图都使用这份数据，不再读取文件。视频没有保留数据，回到开头再读一遍上传到COS：
+    判重必须在上传之前完成，只读一遍就得先上传再删除重复的对象。
+    """
+    with app.app_context():
+        ingest = IngestStream(file.stream)
+        if not ingest.file_type:
+            print(f"⚠️ 不支持的文件类型，已跳过: {file.filename}")
+            return None, '不支持的文件类型'
+        
+        max_size = _max_size_of(ingest.file_type)
+        if ingest.length > max_size:
+            print(f"⚠️ 文件超过大小上限，已跳过: {file.filename}")
+            return None, f'文件超过大小上限 {max_size} 字节'
+        ingest.max_size = max_size
+        
+        ingest.capture = ingest.file_type == 'image'
+        ingest.drain()
+        content_hash = ingest.hexdigest()
+        
+        first, owner = contents.claim(content_hash)
+        if not owner:
+            # 同一请求中已有相同内容的文件，等它上传完成后复用
+            original = first.result()
+            if not original:
+                return None, '上传失败'
+            return _new_material(file.filename, ingest.file_type, original.file_path, ingest.size,
+                                 content_hash, original), None
+        
+        material = None
+        try:
+            material, error = _store_ingested(file, ingest, content_hash)
+        finally:
+            first.set_result(material)
+        return material, error
+
+def _store_ingested(file, ingest, content_hash):
+    """已计算哈希的表单文件：复用已入库的相同内容，否则上传到COS，返回 (未入库的素材对象, 错误信息)"""
+    existing = _find_duplicate(content_hash)
+    _release_db_connection()
+    if existing:
+        return _new_material(file.filename, ingest.file_type, existing.file_path, ingest.size,
+                             content_hash, existing), None
+    
+    is_image = ingest.file_type == 'image'
+    if is_image:
+        data = ingest.captured()
+        body = io.BytesIO(data)
+    else:
+        file.stream.seek(0)
+        body = file.stream
+    upload_result = cloud_storage.upload_file(body, ingest.extension, size=ingest.size,
+                                              content_type=ingest.mime_type)
+    if not upload_result['success']:
+        return None, f"上传失败: {upload_result['error']}"
+    
+    derivatives = _upload_derivatives(data, upload_result['filename']) if is_image else None
+    return _new_material(file.filename, ingest.file_type, upload_result['file_url'], ingest.size,
+                         content_hash, derivatives=derivatives), None
+
 @app.route('/api/upload', methods=['POST'])
 def upload_materials():
     """上传素材文件到云端并调用豆包大模型生成关键词"""
-    if not storage_available:
+    if not cloud_storage:
         return jsonify({'error': '云存储服务不可用'}), 500
         
     try:
-        if 'files' not in request.files:
-            return jsonify({'error': '没有文件'}), 400
+        # 首次访问 request.files 时解析 multipart 请求体并落盘临时文件
+        with metrics.timer('suyuan_stage_seconds', stage='request_parse'):
+            if 'files' not in request.files:
+                return jsonify({'error': '没有文件'}), 400
         
-        files = request.files.getlist('files')
+        files = [file for file in request.files.getlist('files') if file and file.filename]
         # 移除了 location 和 activity_type 的获取
         
-        uploaded_materials = []
+        # 并发上传COS，map 保证结果顺序与上传顺序一致
+        if files:
+            workers = max(1, min(Config.UPLOAD_CONCURRENCY, len(files)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                contents = _RequestContents()
+                results = list(executor.map(lambda file: _ingest_file(file, contents), files))
+        else:
+            results = []
         
-        for file in files:
-            if file and file.filename:
-                file_ext = os.path.splitext(file.filename)[1].lower()
-                
-                upload_result = cloud_storage.upload_file(file.stream, file_ext)
-                if not upload_result['success']:
-                    continue
-                
-                file_type = 'video' if file_ext in ['.mp4', '.mov', '.avi'] else 'image'
-                
-                if hasattr(file.stream, 'seek'):
-                    file.stream.seek(0, 2)
-                    file_size = file.stream.tell()
-                    file.stream.seek(0)
-                else:
-                    file_size = 0
-                
-                # 创建记录（移除了 location 和 activity_type）
-                material = Material(
-                    filename=file.filename,
-                    file_type=file_type,
-                    file_path=upload_result['file_url'],
-                    file_size=file_size
-                    # 移除了 location 和 activity_type
-                )
-                
-                # 调用豆包大模型生成关键词
-                if ai_generator:
-                    if file_type == 'image':
-                        ai_result = ai_generator.generate_keywords_from_image_url(upload_result['file_url'])
-                    else:
-                        ai_result = ai_generator.generate_keywords_from_video(upload_result['file_url'])
-                    
-                    material.ai_keywords = ai_result['ai_keywords']
-                else:
-                    material.ai_keywords = '鹰嘴蜜桃，优质农产品，溯源素材'
-                
-                db.session.add(material)
-                db.session.flush()
-                uploaded_materials.append(material.to_dict())
+        materials = [material for material, _ in results if material]
+        # 被拒绝（类型不支持、超过大小上限）或上传失败的文件逐个返回原因
+        errors = [{'filename': file.filename, 'error': error}
+                  for file, (_, error) in zip(files, results) if error]
+        if errors and not materials:
+            return jsonify({'error': '没有文件上传成功', 'errors': errors}), 400
         
-        db.session.commit()
+        _analyze_materials(materials)
+        
+        # 所有记录在同一个事务中提交
+        uploaded_materials = _save_materials(materials)
         
         return jsonify({
             'message': f'成功上传 {len(uploaded_materials)} 个文件',
+            'materials': uploaded_materials,
+            'errors': errors
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'上传失败: {str(e)}'}), 500
+
+@app.route('/api/upload/stream', methods=['POST'])
+def upload_stream():
+    """流式上传单个大文件：请求体即文件内容，边接收边分块上传到COS
+
+    文件名通过 ?filename= 参数传入。适合大视频，服务端不会先把整个文件落盘。
+    """
+    if not cloud_storage:
+        return jsonify({'error': '云存储服务不可用'}), 500
+    
+    try:
+        filename = request.args.get('filename')
+        if not filename:
+            return jsonify({'error': '缺少 filename 参数'}), 400
+        
+        # 文件类型按请求体开头的魔数识别
+        reader = IngestStream(request.stream)
+        if not reader.file_type:
+            return jsonify({'error': '不支持的文件类型'}), 415
+        
+        max_size = _max_size_of(reader.file_type)
+        if request.content_length and request.content_length > max_size:
+            return jsonify({'error': f'文件超过大小上限 {max_size} 字节'}), 413
+        reader.max_size = max_size
+        # 图片有大小上限，上传的同时保留数据，用于生成衍生图
+        reader.capture = reader.file_type == 'image'
+        
+        upload_result = cloud_storage.upload_file_multipart(reader, reader.extension, reader.mime_type)
+        if not upload_result['success']:
+            return jsonify({'error': f"上传失败: {upload_result['error']}"}), 500
+        
+        content_hash = reader.hexdigest()
+        file_path = upload_result['file_url']
+        
+        # 流式上传无法提前判重，上传完成后发现重复则删除刚上传的对象
+        existing = _find_duplicate(content_hash)
+        _release_db_connection()
+        derivatives = None
+        if existing:
+            cloud_storage.delete_file(upload_result['filename'])
+            file_path = existing.file_path
+        elif reader.file_type == 'image':
+            derivatives = _upload_derivatives(reader.captured(), upload_result['filename'])
+        
+        material = _new_material(filename, reader.file_type, file_path, reader.size, content_hash,
+                                 existing, derivatives)
+        _analyze_materials([material])
+        uploaded_materials = _save_materials([material])
+        
+        return jsonify({
+            'message': '成功上传 1 个文件',
             'materials': uploaded_materials
         }), 200
         
@@ -108,6 +489,154 @@ def upload_materials():
         db.session.rollback()
         return jsonify({'error': f'上传失败: {str(e)}'}), 500
 
+# 客户端直传的上传凭证：签名防篡改，complete 时只信任凭证中的对象键和文件信息
+upload_token_serializer = URLSafeTimedSerializer(Config.SECRET_KEY, salt='direct-upload')
+
+def _material_id_of(object_key):
+    """直传素材的ID由对象键派生，重复调用 complete 不会重复建档"""
+    return str(uuid.UUID(os.path.splitext(object_key.split('/')[-1])[0]))
+
+@app.route('/api/uploads/presign', methods=['POST'])
+def presign_uploads():
+    """客户端直传第一步：为每个文件生成预签名上传地址
+
+    请求体 {"files": [{"filename": "a.jpg", "size": 123}]}。小文件返回一个 PUT 地址，
+    超过分块阈值的文件返回每个分块的 PUT 地址。客户端直接上传到COS后调用
+    /api/uploads/complete，文件内容不经过本服务。
+    """
+    if not cloud_storage:
+        return jsonify({'error': '云存储服务不可用'}), 500
+    
+    try:
+        files = (request.get_json(silent=True) or {}).get('files') or []
+        if not files:
+            return jsonify({'error': '请提供要上传的文件列表'}), 400
+        
+        # 先校验全部文件，再向COS发起分块上传，避免校验失败时残留未完成的分块上传
+        validated = []
+        for item in files:
+            filename = item.get('filename')
+            try:
+                size = int(item.get('size') or 0)
+            except (TypeError, ValueError):
+                size = 0
+            if not filename or size <= 0:
+                return jsonify({'error': '每个文件都需要提供 filename 和 size'}), 400
+            
+            file_ext, file_type = _file_type_of(filename)
+            max_size = _max_size_of(file_type)
+            if size > max_size:
+                return jsonify({'error': f'{filename} 超过大小上限 {max_size} 字节'}), 413
+            validated.append((filename, size, file_ext, file_type))
+        
+        uploads = []
+        multiparts = []
+        try:
+            for filename, size, file_ext, file_type in validated:
+                key = cloud_storage.new_object_key(file_ext)
+                claims = {'key': key, 'filename': filename, 'file_type': file_type}
+                upload = {'filename': filename, 'key': key, 'method': 'PUT'}
+                
+                if size > cloud_storage.multipart_threshold:
+                    # COS 单次分块上传最多 10000 块
+                    part_size = max(cloud_storage.part_size, -(-size // 10000))
+                    upload_id = cloud_storage.create_multipart(key)
+                    multiparts.append((key, upload_id))
+                    claims['upload_id'] = upload_id
+                    upload['part_size'] = part_size
+                    upload['parts'] = [
+                        {'part_number': number, 'url': cloud_storage.presign_part(key, upload_id, number)}
+                        for number in range(1, -(-size // part_size) + 1)
+                    ]
+                else:
+                    upload['url'] = cloud_storage.presign_put(key)
+                
+                upload['token'] = upload_token_serializer.dumps(claims)
+                uploads.append(upload)
+        except Exception:
+            # 客户端拿不到凭证，已发起的分块上传不会再被完成
+            for key, upload_id in multiparts:
+                cloud_storage.abort_multipart(key, upload_id)
+            raise
+        
+        return jsonify({
+            'uploads': uploads,
+            'expires_in': Config.COS_PRESIGN_EXPIRES
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'生成上传地址失败: {str(e)}'}), 500
+
+@app.route('/api/uploads/complete', methods=['POST'])
+def complete_uploads():
+    """客户端直传第二步：确认对象已在COS上，创建素材记录并生成关键词
+
+    请求体 {"uploads": [{"token": "...", "parts": [{"part_number": 1, "etag": "..."}]}]}，
+    parts 只有分块上传需要。文件大小以 HEAD 查到的实际大小为准；直传文件不经过
+    本服务，因此不做内容去重，也不生成衍生图片。
+    """
+    if not cloud_storage:
+        return jsonify({'error': '云存储服务不可用'}), 500
+    
+    try:
+        items = (request.get_json(silent=True) or {}).get('uploads') or []
+        if not items:
+            return jsonify({'error': '请提供上传凭证列表'}), 400
+        
+        materials = []
+        completed = []
+        errors = []
+        for item in items:
+            try:
+                claims = upload_token_serializer.loads(item.get('token') or '', max_age=Config.COS_PRESIGN_EXPIRES * 2)
+            except BadData:
+                errors.append({'token': item.get('token'), 'error': '上传凭证无效或已过期'})
+                continue
+            
+            key = claims['key']
+            existing = db.session.get(Material, _material_id_of(key))
+            if existing:
+                completed.append(existing.to_dict())
+                continue
+            
+            head = cloud_storage.head_file(key)
+            if not head and claims.get('upload_id'):
+                parts = [{'PartNumber': int(part['part_number']), 'ETag': part['etag']}
+                         for part in item.get('parts') or []]
+                try:
+                    cloud_storage.complete_multipart(key, claims['upload_id'], parts)
+                except Exception as e:
+                    errors.append({'filename': claims['filename'], 'error': f'合并分块失败: {str(e)}'})
+                    continue
+                head = cloud_storage.head_file(key)
+            if not head:
+                errors.append({'filename': claims['filename'], 'error': '文件尚未上传到云端'})
+                continue
+            
+            if head['size'] > _max_size_of(claims['file_type']):
+                cloud_storage.delete_file(key)
+                errors.append({'filename': claims['filename'], 'error': '文件超过大小上限，已删除'})
+                continue
+            
+            material = _new_material(claims['filename'], claims['file_type'],
+                                     cloud_storage.file_url(key), head['size'], None)
+            material.id = _material_id_of(key)
+            materials.append(material)
+        
+        _release_db_connection()
+        _analyze_materials(materials)
+        uploaded_materials = _save_materials(materials)
+        
+        return jsonify({
+            'message': f'成功登记 {len(uploaded_materials)} 个文件',
+            'materials': uploaded_materials + completed,
+            'errors': errors
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'登记上传失败: {str(e)}'}), 500
+
 # 删除单个素材（硬删除）
 @app.route('/api/materials/<material_id>', methods=['DELETE'])
 def delete_material(material_id):
@@ -118,18 +647,21 @@ def delete_material(material_id):
         if not material:
             return jsonify({'error': '素材不存在'}), 404
         
-        # 如果配置了云存储，同时删除云端文件
-        if storage_available and cloud_storage:
+        # 如果配置了云存储，同时删除云端文件（仍被其他素材引用时保留）
+        storage_available = bool(cloud_storage)
+        if storage_available and not _is_file_shared(material, [material.id]):
             try:
-                # 从文件路径中提取文件名
-                filename = material.file_path.split('/')[-1]
-                cloud_storage.delete_file(f"materials/{filename}")
-                print(f"🗑️ 已删除云端文件: {filename}")
+                for key in _object_keys(material):
+                    cloud_storage.delete_file(key)
+                    print(f"🗑️ 已删除云端文件: {key}")
             except Exception as e:
                 print(f"⚠️ 云端文件删除失败: {e}")
         
         # 从数据库删除记录
+        MaterialKeyword.delete_for([material.id])
+        KeywordJob.query.filter_by(material_id=material.id).delete(synchronize_session=False)
         db.session.delete(material)
+        DataVersion.bump()
         db.session.commit()
         
         return jsonify({
@@ -142,45 +674,100 @@ def delete_material(material_id):
         db.session.rollback()
         return jsonify({'error': f'删除失败: {str(e)}'}), 500
 
+def _object_key(file_path):
+    """从文件URL中提取COS对象键"""
+    filename = file_path.split('/')[-1]
+    return f"materials/{filename}"
+
+def _object_keys(material):
+    """素材对应的全部COS对象键（原文件及衍生文件）"""
+    urls = [material.file_path] + [getattr(material, field) for field in DERIVATIVE_FIELDS]
+    return [_object_key(url) for url in urls if url]
+
+# 批量删除时只查询需要的列
+DELETE_COLUMNS = (Material.id, Material.file_path, Material.content_hash,
+                  Material.analysis_url, Material.thumbnail_url, Material.web_url,
+                  Material.upload_time, Material.file_type, Material.file_size, Material.ai_status)
+
+def _delete_material_rows(rows):
+    """集合方式删除一批素材（rows 按 DELETE_COLUMNS 查询），并提交事务
+
+    数据库记录删除后，再批量删除不再被任何素材引用的云端文件。
+    返回 (删除记录数, 删除云端文件数, 云端删除失败数)
+    """
+    ids = [row.id for row in rows]
+    deleted = Material.query.filter(Material.id.in_(ids)).delete(synchronize_session=False)
+    MaterialStat.record_deleted(rows, deleted)
+    KeywordJob.query.filter(KeywordJob.material_id.in_(ids)).delete(synchronize_session=False)
+    MaterialKeyword.delete_for(ids)
+    DataVersion.bump()
+    db.session.commit()
+    
+    if not cloud_storage:
+        return len(ids), 0, 0
+    
+    # 去重后多条记录可能共用同一个对象，仍有引用的对象要保留
+    paths = {row.file_path for row in rows}
+    hashes = {row.content_hash for row in rows if row.content_hash}
+    still_referenced = set()
+    if hashes:
+        still_referenced = {
+            file_path for (file_path,) in db.session.query(Material.file_path).filter(
+                Material.content_hash.in_(hashes),
+                Material.file_path.in_(paths)
+            ).distinct()
+        }
+    
+    keys = []
+    for row in rows:
+        if row.file_path not in still_referenced:
+            keys.extend(_object_keys(row))
+    result = cloud_storage.delete_files(list(dict.fromkeys(keys)))
+    return len(ids), result['deleted'], len(result['failed'])
+
 # 批量硬删除
 @app.route('/api/materials/batch', methods=['DELETE'])
 def batch_delete_materials():
-    """批量删除素材（硬删除）"""
+    """批量删除素材（硬删除）
+
+    按 DELETE_CHUNK_SIZE 分批执行 DELETE ... WHERE id IN (...)，每批单独提交，
+    云端文件使用COS批量删除接口（每次最多1000个）。
+    """
     try:
-        material_ids = request.json.get('material_ids', [])
+        material_ids = list(dict.fromkeys(request.json.get('material_ids', [])))
         
         if not material_ids:
             return jsonify({'error': '请提供要删除的素材ID列表'}), 400
         
-        # 查找所有素材
-        materials = Material.query.filter(Material.id.in_(material_ids)).all()
-        
-        if not materials:
-            return jsonify({'error': '未找到指定的素材'}), 404
-        
         deleted_count = 0
         cloud_deleted_count = 0
+        cloud_failed_count = 0
+        progress = []
+        chunk_size = Config.DELETE_CHUNK_SIZE
         
-        for material in materials:
-            # 删除云端文件
-            if storage_available and cloud_storage:
-                try:
-                    filename = material.file_path.split('/')[-1]
-                    if cloud_storage.delete_file(f"materials/{filename}"):
-                        cloud_deleted_count += 1
-                except Exception as e:
-                    print(f"⚠️ 云端文件删除失败: {e}")
+        for start in range(0, len(material_ids), chunk_size):
+            chunk = material_ids[start:start + chunk_size]
+            rows = db.session.query(*DELETE_COLUMNS)\
+                .filter(Material.id.in_(chunk)).all()
+            if not rows:
+                continue
             
-            # 从数据库删除
-            db.session.delete(material)
-            deleted_count += 1
+            deleted, cloud_deleted, cloud_failed = _delete_material_rows(rows)
+            deleted_count += deleted
+            cloud_deleted_count += cloud_deleted
+            cloud_failed_count += cloud_failed
+            progress.append({'deleted': deleted, 'cloud_deleted': cloud_deleted})
+            print(f"🗑️ 批量删除进度: {min(start + chunk_size, len(material_ids))}/{len(material_ids)}")
         
-        db.session.commit()
+        if deleted_count == 0:
+            return jsonify({'error': '未找到指定的素材'}), 404
         
         return jsonify({
             'message': f'成功删除 {deleted_count} 个素材',
             'deleted_count': deleted_count,
-            'cloud_deleted_count': cloud_deleted_count if storage_available else None
+            'cloud_deleted_count': cloud_deleted_count if cloud_storage else None,
+            'cloud_failed_count': cloud_failed_count if cloud_storage else None,
+            'progress': progress
         }), 200
         
     except Exception as e:
@@ -190,37 +777,43 @@ def batch_delete_materials():
 # 清空所有素材
 @app.route('/api/materials/clear', methods=['DELETE'])
 def clear_all_materials():
-    """清空所有素材（谨慎使用！）"""
+    """清空所有素材（谨慎使用！）
+
+    按主键顺序分批删除，每批单独提交；中途失败时已提交的批次不会回滚，
+    重新调用即可继续清空剩余素材。
+    """
     try:
-        # 获取所有素材
-        materials = Material.query.all()
-        total_count = len(materials)
-        
-        if total_count == 0:
-            return jsonify({'message': '没有素材可删除'}), 200
-        
+        total_count = 0
         cloud_deleted_count = 0
+        cloud_failed_count = 0
+        progress = []
+        last_id = ''
         
-        # 删除所有素材
-        for material in materials:
-            # 删除云端文件
-            if storage_available and cloud_storage:
-                try:
-                    filename = material.file_path.split('/')[-1]
-                    if cloud_storage.delete_file(f"materials/{filename}"):
-                        cloud_deleted_count += 1
-                except Exception as e:
-                    print(f"⚠️ 云端文件删除失败: {e}")
+        while True:
+            rows = db.session.query(*DELETE_COLUMNS)\
+                .filter(Material.id > last_id)\
+                .order_by(Material.id)\
+                .limit(Config.DELETE_CHUNK_SIZE).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
             
-            # 从数据库删除
-            db.session.delete(material)
+            deleted, cloud_deleted, cloud_failed = _delete_material_rows(rows)
+            total_count += deleted
+            cloud_deleted_count += cloud_deleted
+            cloud_failed_count += cloud_failed
+            progress.append({'deleted': deleted, 'cloud_deleted': cloud_deleted})
+            print(f"🗑️ 清空进度: 已删除 {total_count} 个素材")
         
-        db.session.commit()
+        if total_count == 0:
+            return jsonify({'message': '没有素材可删除'}), 200
         
         return jsonify({
             'message': f'已清空所有 {total_count} 个素材',
             'total_deleted': total_count,
-            'cloud_deleted_count': cloud_deleted_count if storage_available else None
+            'cloud_deleted_count': cloud_deleted_count if cloud_storage else None,
+            'cloud_failed_count': cloud_failed_count if cloud_storage else None,
+            'progress': progress
         }), 200
         
     except Exception as e:
@@ -229,14 +822,47 @@ def clear_all_materials():
 
 # 获取素材列表
 @app.route('/api/materials', methods=['GET'])
+@response_cache.cached
 def get_materials():
-    """获取所有素材"""
+    """获取所有素材
+
+    传入 cursor 参数（首页传空值）时使用游标分页：按 (upload_time, id) 索引定位，
+    不做 OFFSET 扫描，也不统计总数（with_total=1 时返回精确总数）。
+    不传 cursor 时保持原有的页码分页。
+    传入 fields（如 fields=filename,thumbnail_url）时只查询并返回这些字段，id 和 upload_time 始终返回。
+    """
     try:
-        page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         
+        try:
+            fields = _parse_fields()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if 'cursor' in request.args:
+            return _get_materials_by_cursor(request.args.get('cursor'), per_page, fields)
+        
+        page = request.args.get('page', 1, type=int)
+        
+        if fields:
+            # 按列查询不经过 ORM，分页参数自行校验（与游标分页相同，每页 1~100 条）
+            page = max(1, page)
+            per_page = max(1, min(per_page, 100))
+            total = db.session.query(func.count(Material.id)).scalar()
+            rows = db.session.execute(
+                _material_query(fields)
+                .order_by(Material.upload_time.desc(), Material.id.desc())
+                .limit(per_page).offset((page - 1) * per_page)
+            ).all()
+            return jsonify({
+                'materials': _serialize_materials(rows, fields),
+                'total': total,
+                'pages': -(-total // per_page),
+                'current_page': page
+            }), 200
+        
         # 直接查询所有素材，不需要过滤
-        materials = Material.query.order_by(Material.upload_time.desc())\
+        materials = Material.query.order_by(Material.upload_time.desc(), Material.id.desc())\
             .paginate(page=page, per_page=per_page, error_out=False)
         
         return jsonify({
@@ -249,42 +875,368 @@ def get_materials():
     except Exception as e:
         return jsonify({'error': f'查询失败: {str(e)}'}), 500
 
+def _encode_cursor(material):
+    raw = json.dumps([material.upload_time.isoformat(), material.id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    upload_time, material_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return datetime.fromisoformat(upload_time), material_id
+
+def _estimate_material_count():
+    """素材总数的近似值（MySQL 读取表统计信息，其他数据库不估算）"""
+    if db.engine.dialect.name != 'mysql':
+        return None
+    return db.session.execute(text(
+        "SELECT TABLE_ROWS FROM information_schema.TABLES "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'materials'"
+    )).scalar()
+
+def _parse_fields():
+    """解析 fields= 参数，未传时返回 None（返回完整字段）
+
+    id 和 upload_time 始终包含（游标分页需要）；字段名不合法时抛出 ValueError
+    """
+    raw = request.args.get('fields')
+    if not raw:
+        return None
+    
+    fields = ['id', 'upload_time']
+    for name in raw.split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in MATERIAL_FIELDS:
+            raise ValueError(f'不支持的字段: {name}')
+        fields.append(name)
+    return fields
+
+def _material_query(fields=None):
+    """素材查询：fields 为 None 时使用 ORM 查询，否则只选取这些列（Core select，不构造 ORM 对象）"""
+    if fields is None:
+        return Material.query
+    return select(*(Material.__table__.c[name] for name in fields))
+
+def _serialize_materials(rows, fields=None):
+    if fields is None:
+        return [material.to_dict() for material in rows]
+    return [material_row_to_dict(row) for row in rows]
+
+def _keyset_page(query, cursor, per_page):
+    """按 (upload_time, id) 倒序取一页，返回 (素材列表, 下一页游标)
+
+    query 可以是 ORM 查询或 _material_query 返回的 select；cursor 无法解析时抛出 ValueError
+    """
+    if cursor:
+        try:
+            upload_time, material_id = _decode_cursor(cursor)
+        except Exception:
+            raise ValueError('无效的 cursor')
+        query = query.filter(or_(
+            Material.upload_time < upload_time,
+            and_(Material.upload_time == upload_time, Material.id < material_id)
+        ))
+    
+    # 多取一条用于判断是否还有下一页
+    query = query.order_by(Material.upload_time.desc(), Material.id.desc()).limit(per_page + 1)
+    materials = db.session.execute(query).all() if isinstance(query, Select) else query.all()
+    has_more = len(materials) > per_page
+    materials = materials[:per_page]
+    
+    return materials, _encode_cursor(materials[-1]) if has_more else None
+
+def _get_materials_by_cursor(cursor, per_page, fields=None):
+    """游标分页：每页耗时与所在位置无关"""
+    per_page = max(1, min(per_page, 100))
+    
+    try:
+        materials, next_cursor = _keyset_page(_material_query(fields), cursor, per_page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    result = {
+        'materials': _serialize_materials(materials, fields),
+        'next_cursor': next_cursor
+    }
+    if request.args.get('with_total', type=int):
+        result['total'] = Material.query.count()
+    else:
+        result['total_estimate'] = _estimate_material_count()
+    
+    return jsonify(result), 200
+
+@app.route('/api/materials/search', methods=['GET'])
+@response_cache.cached
+def search_materials():
+    """按关键词搜索素材
+
+    kw：逗号分隔的关键词；op=and（默认，须包含全部关键词）或 op=or（包含任一）。
+    走 material_keywords 索引表，结果按上传时间倒序游标分页；支持 fields 参数。
+    """
+    try:
+        try:
+            fields = _parse_fields()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        keywords = split_keywords(request.args.get('kw', ''))
+        if not keywords:
+            return jsonify({'error': '请提供关键词 kw'}), 400
+        
+        op = request.args.get('op', 'and').lower()
+        if op not in ('and', 'or'):
+            return jsonify({'error': 'op 只能是 and 或 or'}), 400
+        
+        matched_ids = db.session.query(MaterialKeyword.material_id)\
+            .filter(MaterialKeyword.keyword.in_(keywords))
+        if op == 'and':
+            matched_ids = matched_ids.group_by(MaterialKeyword.material_id)\
+                .having(func.count(MaterialKeyword.keyword) == len(keywords))
+        
+        per_page = max(1, min(request.args.get('per_page', 20, type=int), 100))
+        query = _material_query(fields).filter(Material.id.in_(matched_ids))
+        
+        try:
+            materials, next_cursor = _keyset_page(query, request.args.get('cursor'), per_page)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'keywords': keywords,
+            'op': op,
+            'materials': _serialize_materials(materials, fields),
+            'next_cursor': next_cursor
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'搜索失败: {str(e)}'}), 500
+
+@app.route('/api/keywords/facets', methods=['GET'])
+@response_cache.cached
+def keyword_facets():
+    """关键词分面统计：返回出现次数最多的关键词
+
+    不传 kw 时直接读取关键词计数汇总表 keyword_stats；
+    传入 kw 时只统计同时包含这些关键词的素材（用于逐步筛选），只聚合匹配的素材。
+    """
+    try:
+        limit = max(1, min(request.args.get('limit', 20, type=int), 200))
+        selected = split_keywords(request.args.get('kw', ''))
+        
+        if selected:
+            matched_ids = db.session.query(MaterialKeyword.material_id)\
+                .filter(MaterialKeyword.keyword.in_(selected))\
+                .group_by(MaterialKeyword.material_id)\
+                .having(func.count(MaterialKeyword.keyword) == len(selected))
+            count_column = func.count(MaterialKeyword.material_id)
+            rows = db.session.query(MaterialKeyword.keyword, count_column)\
+                .filter(
+                    MaterialKeyword.material_id.in_(matched_ids),
+                    ~MaterialKeyword.keyword.in_(selected)
+                )\
+                .group_by(MaterialKeyword.keyword)\
+                .order_by(count_column.desc(), MaterialKeyword.keyword)\
+                .limit(limit).all()
+        else:
+            rows = KeywordStat.top(limit)
+        
+        return jsonify({
+            'selected': selected,
+            'facets': [{'keyword': keyword, 'count': count} for keyword, count in rows]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'统计失败: {str(e)}'}), 500
+
+def _parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+def _day_range(day):
+    """某一天的 [开始, 结束) 时间范围，便于走 upload_time 索引"""
+    return Material.upload_time >= day, Material.upload_time < day + timedelta(days=1)
+
+def _latest_upload_before(before, start=None):
+    """[start, before) 范围内最近一条素材的上传时间，没有时返回 None"""
+    query = db.session.query(Material.upload_time)
+    if before is not None:
+        query = query.filter(Material.upload_time < before)
+    if start is not None:
+        query = query.filter(Material.upload_time >= start)
+    return query.order_by(Material.upload_time.desc()).limit(1).scalar()
+
 # 时间线视图
 @app.route('/api/timeline', methods=['GET'])
+@response_cache.cached
 def get_timeline():
-    """获取时间线视图"""
+    """获取时间线视图
+
+    按天分组在数据库中完成（GROUP BY 日期），每次只返回一段日期：
+    - start / end：日期范围（YYYY-MM-DD，含两端）
+    - before：日期游标，只返回早于该日期的天，取上一页响应中的 next_before
+    - days：每页覆盖的日期窗口天数（默认30），从最近一个有素材的日期往前数，
+      聚合只扫描该窗口内的行，耗时不随表大小增长；没有素材的日期不返回
+    - per_day：每天附带的素材条数（默认50，传0只返回每天的数量），
+      更多素材通过 /api/timeline/<date> 分页获取
+    - fields：只返回指定的素材字段（同 /api/materials）
+    响应以流的方式输出，不会在内存中拼出完整的时间线。
+    """
     try:
-        materials = Material.query.order_by(Material.upload_time.desc()).all()
+        try:
+            fields = _parse_fields()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        timeline_data = {}
-        for material in materials:
-            date_str = material.upload_time.strftime('%Y-%m-%d')
-            if date_str not in timeline_data:
-                timeline_data[date_str] = []
-            timeline_data[date_str].append(material.to_dict())
+        days = max(1, min(request.args.get('days', 30, type=int), 366))
+        per_day = max(0, min(request.args.get('per_day', 50, type=int), 200))
+        
+        try:
+            start = _parse_day(request.args['start']) if request.args.get('start') else None
+            bounds = [_parse_day(request.args['before'])] if request.args.get('before') else []
+            if request.args.get('end'):
+                bounds.append(_parse_day(request.args['end']) + timedelta(days=1))
+        except ValueError:
+            return jsonify({'error': '日期格式应为 YYYY-MM-DD'}), 400
+        
+        # 窗口从范围内最近一条素材所在的日期开始（按 upload_time 索引取一行），跳过没有素材的日期
+        latest = _latest_upload_before(min(bounds) if bounds else None, start)
+        day_counts = []
+        next_before = None
+        if latest is not None:
+            window_end = datetime.combine(latest.date(), datetime.min.time()) + timedelta(days=1)
+            window_start = window_end - timedelta(days=days)
+            if start is not None:
+                window_start = max(window_start, start)
+            
+            day_column = func.date(Material.upload_time)
+            rows = db.session.query(day_column, func.count(Material.id))\
+                .filter(Material.upload_time >= window_start, Material.upload_time < window_end)\
+                .group_by(day_column)\
+                .order_by(day_column.desc()).all()
+            day_counts = [{'date': str(day), 'count': count} for day, count in rows]
+            if _latest_upload_before(window_start, start) is not None:
+                next_before = window_start.strftime('%Y-%m-%d')
+        
+        def generate():
+            yield '{"days": ' + json.dumps(day_counts) + ', "timeline": {'
+            for index, day_count in enumerate(day_counts):
+                items = []
+                if per_day:
+                    query = _material_query(fields).filter(*_day_range(_parse_day(day_count['date'])))\
+                        .order_by(Material.upload_time.desc(), Material.id.desc())\
+                        .limit(per_day)
+                    materials = db.session.execute(query).all() if fields else query.all()
+                    items = _serialize_materials(materials, fields)
+                separator = ', ' if index else ''
+                yield f'{separator}{json.dumps(day_count["date"])}: {fast_dumps(items)}'
+            yield '}, "next_before": ' + json.dumps(next_before) + '}'
         
-        return jsonify({'timeline': timeline_data}), 200
+        return Response(stream_with_context(generate()), mimetype='application/json'), 200
         
     except Exception as e:
         return jsonify({'error': f'获取时间线失败: {str(e)}'}), 500
 
+@app.route('/api/timeline/<day>', methods=['GET'])
+@response_cache.cached
+def get_timeline_day(day):
+    """分页获取某一天的素材（游标分页，参数同 /api/materials?cursor=，支持 fields 参数）"""
+    try:
+        try:
+            day_start = _parse_day(day)
+        except ValueError:
+            return jsonify({'error': '日期格式应为 YYYY-MM-DD'}), 400
+        
+        try:
+            fields = _parse_fields()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        per_page = max(1, min(request.args.get('per_page', 50, type=int), 200))
+        query = _material_query(fields).filter(*_day_range(day_start))
+        
+        try:
+            materials, next_cursor = _keyset_page(query, request.args.get('cursor'), per_page)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'date': day,
+            'materials': _serialize_materials(materials, fields),
+            'next_cursor': next_cursor
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取时间线失败: {str(e)}'}), 500
+
+def _stats_totals(count, size, fallback):
+    return {
+        'count': int(count or 0),
+        'bytes': int(size or 0),
+        'fallback_count': int(fallback or 0),
+        'fallback_ratio': round(int(fallback or 0) / count, 4) if count else 0
+    }
+
+@app.route('/api/stats', methods=['GET'])
+@response_cache.cached
+def get_stats():
+    """素材统计（读取 material_stats 汇总表，不扫描素材表）
+
+    - 总数、总字节数和备用关键词占比，以及按文件类型的分项
+    - daily：按天的上传数和字节数，最近 days 天（默认30），可用 start / end 限定日期范围
+    """
+    try:
+        days = max(1, min(request.args.get('days', 30, type=int), 366))
+        try:
+            filters = []
+            if request.args.get('start'):
+                filters.append(MaterialStat.day >= _parse_day(request.args['start']).date())
+            if request.args.get('end'):
+                filters.append(MaterialStat.day <= _parse_day(request.args['end']).date())
+        except ValueError:
+            return jsonify({'error': '日期格式应为 YYYY-MM-DD'}), 400
+        
+        sums = (func.sum(MaterialStat.material_count), func.sum(MaterialStat.total_bytes),
+                func.sum(MaterialStat.fallback_count))
+        # 素材全部删除后汇总行会保留为 0，查询时跳过
+        by_type = {
+            file_type: _stats_totals(*values)
+            for file_type, *values in db.session.query(MaterialStat.file_type, *sums)
+                .filter(MaterialStat.material_count > 0)
+                .group_by(MaterialStat.file_type).all()
+        }
+        total = _stats_totals(*db.session.query(*sums).one())
+        
+        daily = db.session.query(MaterialStat.day, *sums[:2])\
+            .filter(MaterialStat.material_count > 0, *filters)\
+            .group_by(MaterialStat.day)\
+            .order_by(MaterialStat.day.desc())\
+            .limit(days).all()
+        
+        return jsonify({
+            'total': total,
+            'by_type': by_type,
+            'daily': [{'date': day.isoformat(), 'count': int(count), 'bytes': int(size)}
+                      for day, count, size in daily]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'获取统计失败: {str(e)}'}), 500
+
 @app.route('/api/materials/<material_id>/reanalyze', methods=['POST'])
 def reanalyze_material(material_id):
     """重新分析素材，生成新的关键词"""
     try:
-        material = Material.query.filter_by(id=material_id, is_deleted=False).first()
+        material = db.session.get(Material, material_id)
         
         if not material:
             return jsonify({'error': '素材不存在'}), 404
         
         if ai_generator:
-            if material.file_type == 'image':
-                ai_result = ai_generator.generate_keywords_from_image_url(material.file_path)
-            else:
-                ai_result = ai_generator.generate_keywords_from_video(material.file_path)
-            
-            material.ai_keywords = ai_result['ai_keywords']
+            # 重新分析时强制调用大模型，新结果会覆盖缓存；可在请求体中用 model 指定模型
+            model = (request.get_json(silent=True) or {}).get('model')
+            _analyze_material(material, bypass_cache=True, model=model)
+            material.sync_keyword_index()
         
+        DataVersion.bump()
         db.session.commit()
         
         return jsonify({
@@ -296,6 +1248,101 @@ def reanalyze_material(material_id):
         db.session.rollback()
         return jsonify({'error': f'重新分析失败: {str(e)}'}), 500
 
+@app.route('/api/sweeps', methods=['POST'])
+def create_sweep():
+    """创建关键词补跑任务
+
+    请求体 {"mode": "failed" | "stale" | "all", "model": "可选，默认当前模型"}；
+    相同范围和模型的任务尚未完成时返回该任务并继续执行。
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            run = keyword_sweeper.start_run(data.get('mode', 'failed'), data.get('model'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'sweep': run.to_dict()}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'创建补跑任务失败: {str(e)}'}), 500
+
+@app.route('/api/sweeps', methods=['GET'])
+def list_sweeps():
+    """最近的补跑任务"""
+    try:
+        runs = SweepRun.query.order_by(SweepRun.created_at.desc()).limit(20).all()
+        return jsonify({'sweeps': [run.to_dict() for run in runs]}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+
+@app.route('/api/sweeps/<run_id>', methods=['GET'])
+def get_sweep(run_id):
+    """查询补跑任务进度"""
+    try:
+        run = db.session.get(SweepRun, run_id)
+        if not run:
+            return jsonify({'error': '补跑任务不存在'}), 404
+        return jsonify({'sweep': run.to_dict()}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+
+@app.route('/api/sweeps/<run_id>/<action>', methods=['POST'])
+def control_sweep(run_id, action):
+    """暂停（pause）或继续（resume）补跑任务"""
+    if action not in ('pause', 'resume'):
+        return jsonify({'error': '不支持的操作'}), 404
+    
+    try:
+        run = keyword_sweeper.set_status(run_id, 'paused' if action == 'pause' else 'running')
+        if not run:
+            return jsonify({'error': '补跑任务不存在或已完成'}), 404
+        return jsonify({'sweep': run.to_dict()}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'操作失败: {str(e)}'}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询关键词生成任务进度"""
+    try:
+        job = db.session.get(KeywordJob, job_id)
+        
+        if not job:
+            return jsonify({'error': '任务不存在'}), 404
+        
+        return jsonify({'job': job.to_dict()}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+
+@app.route('/api/materials/<material_id>/status', methods=['GET'])
+def get_material_status(material_id):
+    """查询素材的关键词生成状态"""
+    try:
+        material = db.session.get(Material, material_id)
+        
+        if not material:
+            return jsonify({'error': '素材不存在'}), 404
+        
+        latest_job = KeywordJob.query.filter_by(material_id=material_id)\
+            .order_by(KeywordJob.created_at.desc()).first()
+        
+        return jsonify({
+            'material_id': material.id,
+            'ai_status': material.ai_status,
+            'ai_attempts': material.ai_attempts,
+            'ai_model': material.ai_model,
+            'ai_keywords': material.ai_keywords,
+            'job': latest_job.to_dict() if latest_job else None
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查（包含数据库连接状态）"""
@@ -307,13 +1354,99 @@ def health_check():
     except Exception as e:
         db_status = f'error: {str(e)}'
     
+    replicas = {}
+    for key in replica_binds():
+        try:
+            with db.engines[key].connect() as connection:
+                connection.execute(text('SELECT 1'))
+            replicas[key] = 'connected'
+        except Exception as e:
+            replicas[key] = f'error: {str(e)}'
+    
+    # 只报告 COS、豆包客户端的当前状态，不触发延迟初始化（尚未初始化时 storage_available 为 null）
+    generator = ai_generator.peek()
     return jsonify({
         'status': 'healthy',
         'database': db_status,
-        'storage_available': storage_available,
+        'database_replicas': replicas,
+        'storage_available': cloud_storage.available(),
+        'ai_async_mode': Config.AI_ASYNC_MODE,
+        'ai_client': generator.client.state() if generator else None,
+        'keyword_cache': generator.cache.stats() if generator and generator.cache else None,
+        'response_cache': response_cache.stats(),
+        'startup': startup_report(),
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus 指标（各阶段耗时直方图、缓存命中和备用关键词计数，按进程统计）"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.cli.command('reindex-keywords')
+def reindex_keywords():
+    """为已有素材重建关键词索引表（flask --app app reindex-keywords）"""
+    last_id = ''
+    total = 0
+    while True:
+        materials = Material.query.filter(Material.id > last_id)\
+            .order_by(Material.id).limit(Config.DELETE_CHUNK_SIZE).all()
+        if not materials:
+            break
+        last_id = materials[-1].id
+        for material in materials:
+            material.sync_keyword_index()
+        DataVersion.bump()
+        db.session.commit()
+        total += len(materials)
+        print(f"🔎 已重建 {total} 个素材的关键词索引")
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats():
+    """按素材表重新计算统计汇总表 material_stats 和关键词计数 keyword_stats（flask --app app rebuild-stats）"""
+    rows = MaterialStat.refresh()
+    keywords = KeywordStat.refresh()
+    DataVersion.bump()
+    db.session.commit()
+    print(f"📊 已重建素材统计：{rows} 条（日期 × 文件类型），关键词计数：{keywords} 个关键词")
+
+@app.cli.command('gc-objects')
+@click.option('--grace-hours', type=float, default=None, help='只删除最后修改时间早于该小时数的对象，默认 ORPHAN_GC_GRACE_HOURS')
+@click.option('--dry-run', is_flag=True, help='只统计孤儿对象，不删除')
+def gc_objects(grace_hours, dry_run):
+    """清理 COS 中没有素材记录引用的孤儿对象（flask --app app gc-objects --dry-run）"""
+    if not cloud_storage:
+        raise click.ClickException('COS 不可用，无法清理')
+    grace_seconds = grace_hours * 3600 if grace_hours is not None else None
+    collector = OrphanCollector(cloud_storage, _object_key, grace_seconds=grace_seconds)
+    report = collector.run(dry_run=dry_run, progress=lambda report: print(
+        f"🗑️ 已扫描 {report['scanned_objects']} 个对象，孤儿 {report['orphans']} 个，已删除 {report['deleted']} 个"))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+@app.cli.command('sweep-keywords')
+@click.option('--mode', type=click.Choice(['failed', 'stale', 'all']), default='failed',
+              help='failed：备用关键词；stale：备用关键词或非目标模型生成；all：全部素材')
+@click.option('--model', default=None, help='使用的模型，默认当前配置的模型')
+def sweep_keywords(mode, model):
+    """在前台执行关键词补跑（flask --app app sweep-keywords --mode all --model xxx），中断后再次执行会继续"""
+    run = keyword_sweeper.start_run(mode, model)
+    print(f"🧹 补跑任务 {run.id}（{run.mode}，模型 {run.model}），已处理 {run.processed} 个素材")
+    run = keyword_sweeper.run_until_done(
+        run.id, lambda run: print(f"🧹 已处理 {run.processed} 个素材，其中 {run.failed} 个仍为备用关键词"))
+    print(f"✅ 补跑任务状态: {run.status}")
+
+# 模块导入（进程冷启动）耗时，不含 COS、豆包客户端的初始化
+import_seconds = time.perf_counter() - _import_started
+
+def startup_report():
+    """启动耗时：模块导入耗时和各外部服务客户端的初始化状态"""
+    return {
+        'import_seconds': round(import_seconds, 3),
+        'services': {service.name: service.state() for service in (cloud_storage, ai_generator)}
+    }
+
+metrics.observe('suyuan_stage_seconds', import_seconds, stage='app_import')
+
 # app.py (修改启动部分)
 if __name__ == '__main__':
     # 移除或注释掉在开发环境下的 db.drop_all() 和 db.create_all()
@@ -321,6 +1454,10 @@ if __name__ == '__main__':
         # 仅创建不存在的表
         db.create_all()
         print("✅ 数据库表已就绪")
+    if Config.AI_EMBEDDED_WORKERS:
+        if Config.AI_ASYNC_MODE:
+            job_queue.ensure_started()
+        keyword_sweeper.ensure_started()
     # 在生产环境中，我们通常不使用 app.run(), 而是用 Gunicorn
     app.run(debug=False, host='0.0.0.0', port=5000) # 设置 debug=False
 
@@ -0,0 +1,193 @@
+"""压测用的本地模拟服务：COS（S3 风格 XML 接口）和豆包 Ark（OpenAI 兼容接口）
+
+两个服务都只保存最少的状态（对象键和大小），响应前按配置的延迟 sleep，
+用来模拟真实网络和推理耗时。
+"""
+import json
+import time
+import uuid
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, parse_qs, unquote, quote
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, body=b'', content_type='application/xml', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+
+class FakeCOSHandler(_QuietHandler):
+    """覆盖本项目用到的 COS 接口：简单上传、分块上传、HEAD、单个/批量删除、列出对象"""
+
+    objects = {}  # 对象键 -> 大小
+    modified = {}  # 对象键 -> 最后修改时间（时间戳）
+    uploads = {}  # UploadId -> {分块号: 大小}
+    lock = threading.Lock()
+    stats = {'put': 0, 'part': 0, 'delete': 0}
+
+    def _parse(self):
+        parts = urlsplit(self.path)
+        return unquote(parts.path.lstrip('/')), parse_qs(parts.query, keep_blank_values=True)
+
+    def do_PUT(self):
+        key, query = self._parse()
+        size = len(self._read_body())
+        time.sleep(self.latency)
+        etag = f'"{uuid.uuid4().hex}"'
+        with self.lock:
+            if 'uploadId' in query:
+                self.uploads.setdefault(query['uploadId'][0], {})[int(query['partNumber'][0])] = size
+                self.stats['part'] += 1
+            else:
+                self.objects[key] = size
+                self.modified[key] = time.time()
+                self.stats['put'] += 1
+        self._send(200, headers={'ETag': etag})
+
+    def do_POST(self):
+        key, query = self._parse()
+        body = self._read_body()
+        time.sleep(self.latency)
+
+        if 'uploads' in query:
+            upload_id = uuid.uuid4().hex
+            with self.lock:
+                self.uploads[upload_id] = {}
+            self._send(200, (
+                f'<InitiateMultipartUploadResult><Bucket>bench</Bucket><Key>{key}</Key>'
+                f'<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>'
+            ).encode())
+        elif 'uploadId' in query:
+            with self.lock:
+                parts = self.uploads.pop(query['uploadId'][0], {})
+                self.objects[key] = sum(parts.values())
+                self.modified[key] = time.time()
+            self._send(200, (
+                f'<CompleteMultipartUploadResult><Key>{key}</Key>'
+                f'<ETag>"{uuid.uuid4().hex}-{len(parts)}"</ETag></CompleteMultipartUploadResult>'
+            ).encode())
+        elif 'delete' in query:
+            keys = [chunk.split('</Key>')[0] for chunk in body.decode().split('<Key>')[1:]]
+            with self.lock:
+                for object_key in keys:
+                    self.objects.pop(object_key, None)
+                self.stats['delete'] += len(keys)
+            self._send(200, b'<DeleteResult></DeleteResult>')
+        else:
+            self._send(400)
+
+    def do_GET(self):
+        """GET Bucket（List Objects）：按对象键顺序分页，对象键 URL 编码（SDK 默认 encoding-type=url）"""
+        _, query = self._parse()
+        prefix = query.get('prefix', [''])[0]
+        marker = query.get('marker', [''])[0]
+        max_keys = int(query.get('max-keys', ['1000'])[0])
+        time.sleep(self.latency)
+
+        with self.lock:
+            keys = sorted(key for key in self.objects if key.startswith(prefix) and key > marker)
+            page = [(key, self.objects[key], self.modified.get(key, 0)) for key in keys[:max_keys]]
+        truncated = len(keys) > max_keys
+
+        contents = ''.join(
+            f'<Contents><Key>{quote(key)}</Key>'
+            f'<LastModified>{datetime.fromtimestamp(mtime, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")}</LastModified>'
+            f'<ETag>"{uuid.uuid4().hex}"</ETag><Size>{size}</Size></Contents>'
+            for key, size, mtime in page
+        )
+        next_marker = f'<NextMarker>{quote(page[-1][0])}</NextMarker>' if truncated else ''
+        self._send(200, (
+            f'<ListBucketResult><Name>bench</Name><Prefix>{quote(prefix)}</Prefix><Marker>{quote(marker)}</Marker>'
+            f'<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{"true" if truncated else "false"}</IsTruncated>'
+            f'{next_marker}{contents}</ListBucketResult>'
+        ).encode())
+
+    def do_HEAD(self):
+        key, _ = self._parse()
+        with self.lock:
+            size = self.objects.get(key)
+        if size is None:
+            self._send(404)
+        else:
+            self.send_response(200)
+            self.send_header('Content-Length', str(size))
+            self.send_header('ETag', f'"{uuid.uuid4().hex}"')
+            self.end_headers()
+
+    def do_DELETE(self):
+        key, query = self._parse()
+        time.sleep(self.latency)
+        with self.lock:
+            if 'uploadId' in query:
+                self.uploads.pop(query['uploadId'][0], None)
+            else:
+                self.objects.pop(key, None)
+                self.stats['delete'] += 1
+        self._send(204)
+
+
+class FakeArkHandler(_QuietHandler):
+    """OpenAI 兼容的 /chat/completions：单图返回关键词，多图返回批量分析的 JSON 数组"""
+
+    lock = threading.Lock()
+    stats = {'calls': 0, 'images': 0}
+
+    def do_POST(self):
+        request = json.loads(self._read_body() or b'{}')
+        content = request.get('messages', [{}])[0].get('content', [])
+        images = sum(1 for item in content if isinstance(item, dict) and item.get('type') == 'image_url')
+        time.sleep(self.latency)
+
+        with self.lock:
+            self.stats['calls'] += 1
+            self.stats['images'] += images
+
+        if images > 1 and any('JSON' in item.get('text', '') for item in content if isinstance(item, dict)):
+            answer = json.dumps([
+                {'index': index, 'keywords': f'压测图片{index}，果园，农作物，新鲜采摘'}
+                for index in range(1, images + 1)
+            ], ensure_ascii=False)
+        else:
+            answer = '压测素材，果园，农作物，新鲜采摘，生态种植'
+
+        body = json.dumps({
+            'id': uuid.uuid4().hex,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'bench'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': answer},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        }, ensure_ascii=False).encode('utf-8')
+        self._send(200, body, content_type='application/json')
+
+
+def start_server(handler, latency=0):
+    """在后台线程中启动模拟服务，返回 (server, 'host:port')"""
+    handler_class = type(handler.__name__, (handler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"{host}:{port}"
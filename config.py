@@ -3,6 +3,27 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def _engine_options(url, pool_size, max_overflow, pool_timeout):
+    """数据库引擎参数：连接池大小只用于支持的连接池（内存 SQLite 使用 StaticPool，不接受这些参数）"""
+    options = {
+        'pool_recycle': 280,
+        'pool_pre_ping': True
+    }
+    if url and not _is_memory_sqlite(url):
+        options.update(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
+    return options
+
+def _is_memory_sqlite(url):
+    from sqlalchemy.engine import make_url
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and (
+        url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory')
+
+def _replica_binds(urls, pool_size, max_overflow, pool_timeout):
+    """只读副本的 bind 配置（Flask-SQLAlchemy 不会把 SQLALCHEMY_ENGINE_OPTIONS 用于 bind，需单独带上）"""
+    return {f'replica_{index}': dict(_engine_options(url, pool_size, max_overflow, pool_timeout), url=url)
+            for index, url in enumerate(urls)}
+
 class Config:
     # 基础配置
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'yanshuimitao-secret-key'
@@ -10,21 +31,105 @@ class Config:
     # 云数据库MySQL配置
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        'pool_recycle': 280,
-        'pool_pre_ping': True
-    }
+    # 连接池按每个 worker 进程计算：总连接数约为 worker 数 ×（DB_POOL_SIZE + DB_MAX_OVERFLOW）
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))  # 秒，等待空闲连接的时间
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT)
+    # 只读副本（逗号分隔的数据库连接串），GET 请求的查询路由到副本
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    SQLALCHEMY_BINDS = _replica_binds(DATABASE_REPLICA_URLS, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT)
+    # 写请求之后多少秒内，该客户端的读请求仍走主库（需大于副本的复制延迟）
+    DB_REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
     
-    # 文件上传配置
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
+    # 文件上传配置（按文件类型限制大小，请求体上限取其中较大者）
+    MAX_IMAGE_SIZE = int(os.environ.get('MAX_IMAGE_SIZE', 16 * 1024 * 1024))  # 16MB
+    MAX_VIDEO_SIZE = int(os.environ.get('MAX_VIDEO_SIZE', 2 * 1024 * 1024 * 1024))  # 2GB
+    MAX_CONTENT_LENGTH = max(MAX_IMAGE_SIZE, MAX_VIDEO_SIZE)
+    # 单次上传中并发处理文件（上传COS + 生成关键词）的线程数上限
+    UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY', 4))
+    # 图片衍生文件（分析小图、缩略图、WebP）生成的进程数和超时时间（秒）
+    DERIVATIVE_WORKERS = int(os.environ.get('DERIVATIVE_WORKERS', 2))
+    DERIVATIVE_TIMEOUT = int(os.environ.get('DERIVATIVE_TIMEOUT', 60))
+    # 批量删除时每批处理的素材数
+    DELETE_CHUNK_SIZE = int(os.environ.get('DELETE_CHUNK_SIZE', 500))
     
     # 豆包API配置
     ARK_API_KEY = os.environ.get('ARK_API_KEY')
     DOUBAO_MODEL = os.environ.get('DOUBAO_MODEL')
     DOUBAO_BASE_URL = os.environ.get('DOUBAO_BASE_URL', 'https://ark.cn-beijing.volces.com/api/v3')
+    # 是否开启端到端加密（对接本地模拟服务做压测时需要关闭）
+    DOUBAO_E2E_ENCRYPTION = os.environ.get('DOUBAO_E2E_ENCRYPTION', 'true').lower() == 'true'
+    # 豆包调用保护：限流、并发上限、超时、重试和熔断
+    ARK_RATE_LIMIT = float(os.environ.get('ARK_RATE_LIMIT', 5))  # 每秒请求数
+    ARK_RATE_BURST = int(os.environ.get('ARK_RATE_BURST', 10))
+    # 配置后令牌桶放在 Redis 中，ARK_RATE_LIMIT 为所有 worker 合计的速率；未配置时按每个 worker 计算
+    ARK_RATE_LIMIT_REDIS_URL = os.environ.get('ARK_RATE_LIMIT_REDIS_URL')
+    ARK_MAX_CONCURRENCY = int(os.environ.get('ARK_MAX_CONCURRENCY', 8))
+    ARK_TIMEOUT = float(os.environ.get('ARK_TIMEOUT', 60))  # 秒，单次调用
+    ARK_MAX_RETRIES = int(os.environ.get('ARK_MAX_RETRIES', 2))
+    ARK_RETRY_BASE_DELAY = float(os.environ.get('ARK_RETRY_BASE_DELAY', 1))  # 秒
+    ARK_BREAKER_THRESHOLD = int(os.environ.get('ARK_BREAKER_THRESHOLD', 5))  # 连续失败次数
+    ARK_BREAKER_RESET = float(os.environ.get('ARK_BREAKER_RESET', 30))  # 秒，熔断后多久放行探测请求
+    # COS、豆包客户端首次使用时才初始化，初始化失败后间隔多久重试
+    SERVICE_RETRY_INTERVAL = float(os.environ.get('SERVICE_RETRY_INTERVAL', 30))  # 秒
+    # 批量上传时每次请求打包分析的图片数
+    AI_BATCH_SIZE = int(os.environ.get('AI_BATCH_SIZE', 4))
+    
+    # 视频分析：均匀抽取若干关键帧，与提示词一起在一次请求中发送给大模型
+    FFMPEG_BIN = os.environ.get('FFMPEG_BIN', 'ffmpeg')
+    VIDEO_KEYFRAME_COUNT = int(os.environ.get('VIDEO_KEYFRAME_COUNT', 6))
+    VIDEO_KEYFRAME_MAX_SIDE = int(os.environ.get('VIDEO_KEYFRAME_MAX_SIDE', 512))
+    VIDEO_KEYFRAME_TIMEOUT = int(os.environ.get('VIDEO_KEYFRAME_TIMEOUT', 30))  # 秒，一次抽帧（探测时长 + 各帧）的总时限
+    
+    # AI关键词缓存配置（进程内 LRU + 数据库持久层）
+    KEYWORD_CACHE_ENABLED = os.environ.get('KEYWORD_CACHE_ENABLED', 'true').lower() == 'true'
+    KEYWORD_CACHE_SIZE = int(os.environ.get('KEYWORD_CACHE_SIZE', 1024))
+    KEYWORD_CACHE_TTL = int(os.environ.get('KEYWORD_CACHE_TTL', 30 * 24 * 3600))  # 秒
+    KEYWORD_CACHE_DB_MAX_ENTRIES = int(os.environ.get('KEYWORD_CACHE_DB_MAX_ENTRIES', 100000))
     
     # 腾讯云COS配置
     COS_SECRET_ID = os.environ.get('COS_SECRET_ID')
     COS_SECRET_KEY = os.environ.get('COS_SECRET_KEY')
     COS_REGION = os.environ.get('COS_REGION', 'ap-guangzhou')
-    COS_BUCKET = os.environ.get('COS_BUCKET')
\ No newline at end of file
+    COS_BUCKET = os.environ.get('COS_BUCKET')
+    # 自定义访问域名和协议（如压测时指向本地模拟服务 127.0.0.1:9000 + http），默认使用官方域名
+    COS_DOMAIN = os.environ.get('COS_DOMAIN')
+    COS_SCHEME = os.environ.get('COS_SCHEME', 'https')
+    # 每个进程到 COS 的 HTTP 连接池大小（gevent 协程模式下并发请求多，需要相应调大）
+    COS_POOL_SIZE = int(os.environ.get('COS_POOL_SIZE', 10))
+    # 分块上传配置：超过阈值的文件按 COS_PART_SIZE 分块并发上传
+    COS_MULTIPART_THRESHOLD = int(os.environ.get('COS_MULTIPART_THRESHOLD', 20 * 1024 * 1024))
+    COS_PART_SIZE = int(os.environ.get('COS_PART_SIZE', 8 * 1024 * 1024))  # COS要求除最后一块外不小于1MB
+    COS_PART_WORKERS = int(os.environ.get('COS_PART_WORKERS', 4))
+    COS_PART_RETRIES = int(os.environ.get('COS_PART_RETRIES', 3))
+    # 客户端直传预签名地址的有效期（秒）
+    COS_PRESIGN_EXPIRES = int(os.environ.get('COS_PRESIGN_EXPIRES', 3600))
+    
+    # COS 孤儿对象清理：最后修改时间在宽限期内的对象不删除（需远大于 COS_PRESIGN_EXPIRES，覆盖直传到 complete 的间隔）
+    ORPHAN_GC_GRACE_HOURS = float(os.environ.get('ORPHAN_GC_GRACE_HOURS', 24))
+    # 外部排序时每个分块在内存中保留的对象键数
+    ORPHAN_GC_CHUNK_SIZE = int(os.environ.get('ORPHAN_GC_CHUNK_SIZE', 100000))
+    
+    # 读接口响应缓存配置（配置 RESPONSE_CACHE_REDIS_URL 后多个 worker 共享缓存）
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))
+    RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 600))  # 秒，仅 Redis 使用
+    RESPONSE_CACHE_REDIS_URL = os.environ.get('RESPONSE_CACHE_REDIS_URL')
+    
+    # 异步关键词生成配置
+    # 开启后上传接口只写入素材记录，关键词由后台工作线程补全
+    AI_ASYNC_MODE = os.environ.get('AI_ASYNC_MODE', 'false').lower() == 'true'
+    # 是否在Web进程内启动工作线程（关闭时需单独运行 worker.py）
+    AI_EMBEDDED_WORKERS = os.environ.get('AI_EMBEDDED_WORKERS', 'true').lower() == 'true'
+    AI_WORKER_THREADS = int(os.environ.get('AI_WORKER_THREADS', 2))
+    AI_JOB_MAX_ATTEMPTS = int(os.environ.get('AI_JOB_MAX_ATTEMPTS', 3))
+    AI_JOB_TIMEOUT = int(os.environ.get('AI_JOB_TIMEOUT', 300))  # 秒，超时的运行中任务会被重新领取
+    AI_JOB_POLL_INTERVAL = float(os.environ.get('AI_JOB_POLL_INTERVAL', 2))
+    
+    # 关键词补跑配置：分批重新分析备用关键词或旧模型生成的素材
+    SWEEP_BATCH_SIZE = int(os.environ.get('SWEEP_BATCH_SIZE', 20))
+    SWEEP_INTERVAL = float(os.environ.get('SWEEP_INTERVAL', 5))  # 秒，批次之间的间隔
+    SWEEP_MAX_ATTEMPTS = int(os.environ.get('SWEEP_MAX_ATTEMPTS', 5))  # 超过该尝试次数的素材不再自动补跑
+    SWEEP_AUTO_INTERVAL = int(os.environ.get('SWEEP_AUTO_INTERVAL', 3600))  # 秒，定时补跑备用关键词，0 表示关闭
+    SWEEP_POLL_INTERVAL = float(os.environ.get('SWEEP_POLL_INTERVAL', 30))
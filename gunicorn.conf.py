@@ -0,0 +1,35 @@
+# gunicorn 配置：gunicorn app:app（自动读取当前目录下的本文件）
+#
+# 只应用显式设置的 GUNICORN_* 环境变量，未设置的项保持 gunicorn 自身的默认值
+# （1 个 sync worker、绑定 127.0.0.1:8000、超时 30 秒），也可以继续用命令行参数指定。
+# 每个 worker 各有一个最多 DB_POOL_SIZE + DB_MAX_OVERFLOW 个连接的数据库连接池，
+# 增加 GUNICORN_WORKERS 前先确认数据库的 max_connections 够用。
+#
+# 本服务的耗时几乎都在等待 COS、豆包和 MySQL。默认的 sync worker 每个进程同一时间只处理一个请求；
+# GUNICORN_WORKER_CLASS=gevent 时改为协程模式，socket 读写被替换为非阻塞实现
+# （requests / httpx / PyMySQL 都是纯 Python socket 调用），单个进程可同时处理数百个慢上传。
+import os
+
+_SETTINGS = {
+    'bind': ('GUNICORN_BIND', str),
+    'worker_class': ('GUNICORN_WORKER_CLASS', str),
+    'workers': ('GUNICORN_WORKERS', int),
+    # 大文件上传和大模型调用可能持续数分钟，需要时调大 GUNICORN_TIMEOUT
+    'timeout': ('GUNICORN_TIMEOUT', int),
+    'graceful_timeout': ('GUNICORN_GRACEFUL_TIMEOUT', int),
+    'keepalive': ('GUNICORN_KEEPALIVE', int),
+    # 协程模式下每个 worker 同时处理的连接数上限
+    'worker_connections': ('GUNICORN_WORKER_CONNECTIONS', int),
+}
+
+for _name, (_variable, _cast) in _SETTINGS.items():
+    if os.environ.get(_variable):
+        globals()[_name] = _cast(os.environ[_variable])
+
+if os.environ.get('GUNICORN_WORKER_CLASS') == 'gevent':
+    # gevent 会去掉 select.epoll；httpcore（豆包 SDK 经 httpx 使用）导入时会尝试导入 trio，
+    # 在已打补丁的 worker 中导入会失败。在主进程提前导入，worker fork 后直接复用
+    try:
+        import httpcore  # noqa: F401
+    except ImportError:
+        pass
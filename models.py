@@ -1,23 +1,45 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import func, case, inspect
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, date, timedelta
 import uuid
+from utils.db_routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class Material(db.Model):
     __tablename__ = 'materials'
+    __table_args__ = (
+        # 列表和时间线按 (upload_time, id) 游标分页
+        db.Index('ix_materials_upload_time_id', 'upload_time', 'id'),
+        # 后台补跑按状态筛选，再按上传时间倒序处理
+        db.Index('ix_materials_ai_status_upload_time', 'ai_status', 'upload_time', 'id'),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     filename = db.Column(db.String(255), nullable=False)
     file_type = db.Column(db.String(10), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     file_size = db.Column(db.Integer, default=0)
+    # 图片衍生文件：大模型分析用小图、列表缩略图、网页展示用 WebP
+    analysis_url = db.Column(db.String(500))
+    thumbnail_url = db.Column(db.String(500))
+    web_url = db.Column(db.String(500))
+    # 文件内容的 SHA-256，用于上传去重
+    content_hash = db.Column(db.String(64), index=True)
     
     # 基础元数据
     upload_time = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
     # AI生成的关键词（现在支持所有农作物）
     ai_keywords = db.Column(db.Text, default='')
+    # 关键词生成状态：pending（排队中）/ done（已完成）/ failed（当前是备用关键词，等待补跑）
+    # active_history：修改前总是加载旧值，统计汇总需要知道状态从什么变成什么
+    ai_status = db.column_property(db.Column(db.String(16), default='done', nullable=False), active_history=True)
+    # 关键词生成的累计尝试次数、最近一次使用的模型和时间
+    ai_attempts = db.Column(db.Integer, default=0, nullable=False)
+    ai_model = db.Column(db.String(64))
+    ai_updated_at = db.Column(db.DateTime)
     
     def to_dict(self):
         return {
@@ -25,14 +47,420 @@ class Material(db.Model):
             'filename': self.filename,
             'file_type': self.file_type,
             'file_path': self.file_path,
+            'thumbnail_url': self.thumbnail_url,
+            'web_url': self.web_url,
+            'analysis_url': self.analysis_url,
             'file_size': self.file_size,
+            'content_hash': self.content_hash,
             'upload_time': self.upload_time.isoformat(),
-            'ai_keywords': self.ai_keywords
+            'ai_keywords': self.ai_keywords,
+            'ai_status': self.ai_status,
+            'ai_attempts': self.ai_attempts,
+            'ai_model': self.ai_model,
+            'ai_updated_at': self.ai_updated_at.isoformat() if self.ai_updated_at else None
         }
     
+    def record_analysis(self, ai_result, model=None):
+        """记录一次关键词生成结果，备用关键词（success 为 False）记为 failed 等待补跑
+
+        没有调用大模型的备用结果（attempted 为 False）不计入尝试次数
+        """
+        self.ai_keywords = ai_result['ai_keywords']
+        self.ai_status = 'done' if ai_result.get('success') else 'failed'
+        self.ai_model = model
+        if ai_result.get('attempted', True):
+            self.ai_attempts = (self.ai_attempts or 0) + 1
+        self.ai_updated_at = datetime.utcnow()
+    
+    def sync_keyword_index(self):
+        """按当前 ai_keywords 更新该素材在关键词索引表中的记录和关键词计数（随调用方事务提交）"""
+        keywords = split_keywords(self.ai_keywords)
+        existing = {keyword for (keyword,) in db.session.query(MaterialKeyword.keyword)
+                    .filter_by(material_id=self.id)}
+        removed = existing.difference(keywords)
+        if removed:
+            MaterialKeyword.query.filter(
+                MaterialKeyword.material_id == self.id,
+                MaterialKeyword.keyword.in_(removed)
+            ).delete(synchronize_session=False)
+        added = [keyword for keyword in keywords if keyword not in existing]
+        for keyword in added:
+            db.session.add(MaterialKeyword(material_id=self.id, keyword=keyword))
+        
+        deltas = dict.fromkeys(added, 1)
+        deltas.update(dict.fromkeys(removed, -1))
+        KeywordStat.apply(db.session.connection(), deltas)
+    
     def __init__(self, **kwargs):
         if 'id' not in kwargs:
             kwargs['id'] = str(uuid.uuid4())
         if 'upload_time' not in kwargs:
             kwargs['upload_time'] = datetime.utcnow()
-        super().__init__(**kwargs)
\ No newline at end of file
+        kwargs.setdefault('ai_attempts', 0)
+        super().__init__(**kwargs)
+
+
+# to_dict 输出的字段，列表接口的 fields= 参数只能从中选择
+MATERIAL_FIELDS = (
+    'id', 'filename', 'file_type', 'file_path', 'thumbnail_url', 'web_url', 'analysis_url',
+    'file_size', 'content_hash', 'upload_time', 'ai_keywords', 'ai_status',
+    'ai_attempts', 'ai_model', 'ai_updated_at'
+)
+
+def material_row_to_dict(row):
+    """把按列查询得到的素材行转换为与 to_dict 格式一致的字典（只包含查询的列）"""
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in row._mapping.items()
+    }
+
+
+def split_keywords(ai_keywords):
+    """把逗号拼接的关键词拆成去重后的列表"""
+    keywords = []
+    for keyword in (ai_keywords or '').replace(',', '，').split('，'):
+        keyword = keyword.strip()[:64]
+        if len(keyword) > 1 and keyword not in keywords:
+            keywords.append(keyword)
+    return keywords
+
+
+class MaterialKeyword(db.Model):
+    """关键词倒排索引：关键词 -> 素材"""
+    __tablename__ = 'material_keywords'
+    __table_args__ = (
+        db.Index('ix_material_keywords_keyword', 'keyword', 'material_id'),
+    )
+    
+    material_id = db.Column(db.String(36), primary_key=True)
+    keyword = db.Column(db.String(64), primary_key=True)
+    
+    @classmethod
+    def delete_for(cls, material_ids):
+        """删除这些素材的关键词索引并扣减关键词计数（随调用方事务提交）
+
+        实际删除的行数与统计不一致时（并发删除了同一素材），改为重新统计涉及的关键词。
+        """
+        condition = cls.material_id.in_(material_ids)
+        counts = dict(db.session.query(cls.keyword, func.count(cls.material_id))
+                      .filter(condition).group_by(cls.keyword).all())
+        deleted = cls.query.filter(condition).delete(synchronize_session=False)
+        if deleted == sum(counts.values()):
+            KeywordStat.apply(db.session.connection(), {keyword: -count for keyword, count in counts.items()})
+        else:
+            KeywordStat.refresh(counts.keys())
+
+
+class KeywordJob(db.Model):
+    """关键词生成任务（异步模式下由后台工作线程消费）"""
+    __tablename__ = 'keyword_jobs'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    material_id = db.Column(db.String(36), nullable=False, index=True)
+    # 任务状态：pending / running / done / failed
+    status = db.Column(db.String(16), default='pending', nullable=False, index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'material_id': self.material_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+    
+    def __init__(self, **kwargs):
+        if 'id' not in kwargs:
+            kwargs['id'] = str(uuid.uuid4())
+        now = datetime.utcnow()
+        kwargs.setdefault('created_at', now)
+        kwargs.setdefault('updated_at', now)
+        kwargs.setdefault('status', 'pending')
+        kwargs.setdefault('attempts', 0)
+        super().__init__(**kwargs)
+
+
+class SweepRun(db.Model):
+    """关键词补跑任务：按上传时间倒序分批重新分析素材，游标持久化以便中断后继续"""
+    __tablename__ = 'sweep_runs'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    # 范围：failed（备用关键词）/ stale（备用关键词或非目标模型生成）/ all（全部素材）
+    mode = db.Column(db.String(16), nullable=False)
+    # 使用的模型
+    model = db.Column(db.String(64))
+    # 状态：running / paused / done
+    status = db.Column(db.String(16), default='running', nullable=False, index=True)
+    # 是否由后台定时创建
+    auto = db.Column(db.Boolean, default=False, nullable=False)
+    # 已处理到的位置（上一批最后一条素材的 upload_time 和 id）
+    cursor_time = db.Column(db.DateTime)
+    cursor_id = db.Column(db.String(36))
+    processed = db.Column(db.Integer, default=0, nullable=False)
+    failed = db.Column(db.Integer, default=0, nullable=False)
+    # 处理中的租约，避免多个进程同时处理同一个任务
+    lease_until = db.Column(db.DateTime)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'mode': self.mode,
+            'model': self.model,
+            'status': self.status,
+            'auto': self.auto,
+            'processed': self.processed,
+            'failed': self.failed,
+            'cursor_time': self.cursor_time.isoformat() if self.cursor_time else None,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+    
+    def __init__(self, **kwargs):
+        if 'id' not in kwargs:
+            kwargs['id'] = str(uuid.uuid4())
+        now = datetime.utcnow()
+        kwargs.setdefault('created_at', now)
+        kwargs.setdefault('updated_at', now)
+        kwargs.setdefault('status', 'running')
+        kwargs.setdefault('auto', False)
+        kwargs.setdefault('processed', 0)
+        kwargs.setdefault('failed', 0)
+        super().__init__(**kwargs)
+
+
+class KeywordCacheEntry(db.Model):
+    """AI关键词缓存的持久层"""
+    __tablename__ = 'keyword_cache'
+    
+    # sha256(模型|提示词版本|内容哈希)
+    cache_key = db.Column(db.String(64), primary_key=True)
+    ai_keywords = db.Column(db.Text, nullable=False)
+    model = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class DataVersion(db.Model):
+    """数据版本号：素材数据每次变更时递增，用于生成读接口的 ETag
+
+    也用来记录定时任务的上次执行时间（claim_interval），多个进程据此只执行一次。
+    """
+    __tablename__ = 'data_versions'
+    
+    name = db.Column(db.String(32), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    @classmethod
+    def bump(cls, name='materials'):
+        """递增版本号（随调用方事务提交）"""
+        now = datetime.utcnow()
+        updated = cls.query.filter_by(name=name)\
+            .update({'version': cls.version + 1, 'updated_at': now}, synchronize_session=False)
+        if not updated:
+            db.session.add(cls(name=name, version=1, updated_at=now))
+    
+    @classmethod
+    def claim_interval(cls, name, interval):
+        """距离上次领取超过 interval 时领取并返回 True（立即提交）
+
+        条件更新 updated_at，多个进程同时调用时只有一个成功；记录不存在时插入，主键冲突的一方失败。
+        """
+        now = datetime.utcnow()
+        claimed = cls.query.filter(cls.name == name, cls.updated_at <= now - interval)\
+            .update({'version': cls.version + 1, 'updated_at': now}, synchronize_session=False)
+        if not claimed and db.session.query(cls.name).filter_by(name=name).first() is None:
+            db.session.add(cls(name=name, version=1, updated_at=now))
+            claimed = 1
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return False
+        return bool(claimed)
+    
+    @classmethod
+    def current(cls, name='materials'):
+        """返回 (版本号, 更新时间)，尚无记录时为 (0, None)"""
+        row = db.session.query(cls.version, cls.updated_at).filter_by(name=name).first()
+        return (row.version, row.updated_at) if row else (0, None)
+
+class MaterialStat(db.Model):
+    """素材统计汇总：按 (日期, 文件类型) 累计素材数、字节数和备用关键词数
+
+    通过 ORM 新增、删除素材或修改 ai_status 时，在 flush 中随同一事务增量更新
+    （见 _track_material_stats）；集合方式的批量删除需要调用 record_deleted。
+    """
+    __tablename__ = 'material_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    file_type = db.Column(db.String(10), primary_key=True)
+    material_count = db.Column(db.Integer, default=0, nullable=False)
+    total_bytes = db.Column(db.BigInteger, default=0, nullable=False)
+    # ai_status 为 failed（当前是备用关键词）的素材数
+    fallback_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    @classmethod
+    def apply(cls, connection, deltas):
+        """累加 {(日期, 文件类型): [素材数, 字节数, 备用关键词数]}（原子的 upsert，并发写入不会丢失计数）"""
+        for (day, file_type), (count, size, fallback) in deltas.items():
+            if not (count or size or fallback):
+                continue
+            _upsert_increment(connection, cls, {'day': day, 'file_type': file_type}, {
+                'material_count': count, 'total_bytes': size, 'fallback_count': fallback
+            })
+    
+    @classmethod
+    def record_deleted(cls, rows, deleted_count):
+        """集合方式删除素材后扣减统计（rows 需包含 upload_time、file_type、file_size、ai_status）
+
+        实际删除的行数与 rows 不一致时（部分素材已被并发请求删除），改为按涉及的日期重新统计。
+        """
+        deltas = {}
+        for row in rows:
+            _add_delta(deltas, row.upload_time, row.file_type, -1, -(row.file_size or 0),
+                       -1 if row.ai_status == 'failed' else 0)
+        if deleted_count == len(rows):
+            cls.apply(db.session.connection(), deltas)
+        else:
+            cls.refresh(deltas.keys())
+    
+    @classmethod
+    def refresh(cls, keys=None):
+        """按素材表重新统计指定的 (日期, 文件类型)，keys 为空时全部重建（随调用方事务提交）"""
+        day_column = func.date(Material.upload_time)
+        query = db.session.query(
+            day_column, Material.file_type, func.count(Material.id),
+            func.coalesce(func.sum(Material.file_size), 0),
+            func.coalesce(func.sum(case((Material.ai_status == 'failed', 1), else_=0)), 0)
+        )
+        
+        if keys is None:
+            cls.query.delete(synchronize_session=False)
+            rows = query.group_by(day_column, Material.file_type).all()
+        else:
+            rows = []
+            for day, file_type in keys:
+                cls.query.filter_by(day=day, file_type=file_type).delete(synchronize_session=False)
+                start = datetime.combine(day, datetime.min.time())
+                rows.extend(query.filter(
+                    Material.upload_time >= start,
+                    Material.upload_time < start + timedelta(days=1),
+                    Material.file_type == file_type
+                ).group_by(day_column, Material.file_type).all())
+        
+        for day, file_type, count, size, fallback in rows:
+            # SQLite 的 date() 返回字符串
+            day = day if isinstance(day, date) else date.fromisoformat(str(day))
+            db.session.add(cls(day=day, file_type=file_type, material_count=count,
+                               total_bytes=int(size), fallback_count=int(fallback)))
+        return len(rows)
+
+
+def _upsert_increment(connection, model, keys, increments):
+    """按主键 keys 累加计数列，行不存在时插入（原子的 upsert，并发写入不会丢失计数）"""
+    values = dict(keys, **increments)
+    updates = {column: getattr(model, column) + amount for column, amount in increments.items()}
+    
+    dialect = connection.dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        connection.execute(insert(model).values(**values).on_duplicate_key_update(**updates))
+    elif dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        connection.execute(insert(model).values(**values)
+                           .on_conflict_do_update(index_elements=list(keys), set_=updates))
+    else:
+        conditions = [getattr(model, column) == value for column, value in keys.items()]
+        updated = connection.execute(db.update(model).where(*conditions).values(**updates))
+        if not updated.rowcount:
+            connection.execute(db.insert(model).values(**values))
+
+
+class KeywordStat(db.Model):
+    """关键词计数汇总：每个关键词关联的素材数，关键词分面直接读取前 N 个，不扫描 material_keywords
+
+    sync_keyword_index 和 MaterialKeyword.delete_for 在同一事务中增量更新。
+    """
+    __tablename__ = 'keyword_stats'
+    __table_args__ = (
+        # 分面按数量倒序取前 N 个
+        db.Index('ix_keyword_stats_count', 'material_count', 'keyword'),
+    )
+    
+    keyword = db.Column(db.String(64), primary_key=True)
+    material_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    @classmethod
+    def apply(cls, connection, deltas):
+        """累加 {关键词: 素材数变化}"""
+        for keyword, count in deltas.items():
+            if count:
+                _upsert_increment(connection, cls, {'keyword': keyword}, {'material_count': count})
+    
+    @classmethod
+    def top(cls, limit):
+        """素材数最多的关键词 [(关键词, 素材数)]"""
+        return db.session.query(cls.keyword, cls.material_count)\
+            .filter(cls.material_count > 0)\
+            .order_by(cls.material_count.desc(), cls.keyword)\
+            .limit(limit).all()
+    
+    @classmethod
+    def refresh(cls, keywords=None):
+        """按 material_keywords 重新统计指定的关键词，keywords 为空时全部重建（随调用方事务提交）"""
+        query = db.session.query(MaterialKeyword.keyword, func.count(MaterialKeyword.material_id))
+        if keywords is None:
+            cls.query.delete(synchronize_session=False)
+        else:
+            keywords = list(keywords)
+            cls.query.filter(cls.keyword.in_(keywords)).delete(synchronize_session=False)
+            query = query.filter(MaterialKeyword.keyword.in_(keywords))
+        rows = query.group_by(MaterialKeyword.keyword).all()
+        for keyword, count in rows:
+            db.session.add(cls(keyword=keyword, material_count=count))
+        return len(rows)
+
+
+def _add_delta(deltas, upload_time, file_type, count, size, fallback):
+    delta = deltas.setdefault((upload_time.date(), file_type), [0, 0, 0])
+    delta[0] += count
+    delta[1] += size
+    delta[2] += fallback
+
+
+@db.event.listens_for(db.session, 'before_flush')
+def _track_material_stats(session, flush_context, instances):
+    """把本次 flush 中素材的新增、删除和 ai_status 变化累加到 material_stats"""
+    deltas = {}
+    for material in session.new:
+        if isinstance(material, Material):
+            _add_delta(deltas, material.upload_time, material.file_type, 1, material.file_size or 0,
+                       1 if material.ai_status == 'failed' else 0)
+    for material in session.deleted:
+        if isinstance(material, Material):
+            _add_delta(deltas, material.upload_time, material.file_type, -1, -(material.file_size or 0),
+                       -1 if material.ai_status == 'failed' else 0)
+    for material in session.dirty:
+        if isinstance(material, Material):
+            history = inspect(material).attrs.ai_status.history
+            if not history.has_changes():
+                continue
+            was_failed = 'failed' in (history.deleted or ())
+            is_failed = material.ai_status == 'failed'
+            if was_failed != is_failed:
+                _add_delta(deltas, material.upload_time, material.file_type, 0, 0, 1 if is_failed else -1)
+    if deltas:
+        MaterialStat.apply(session.connection(), deltas)
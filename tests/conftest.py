@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+from collections import OrderedDict
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Config 在导入时读取环境变量，必须在导入 app 之前设置
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='suyuan-test-'), 'test.db')}"
+os.environ['AI_EMBEDDED_WORKERS'] = 'false'
+os.environ['AI_ASYNC_MODE'] = 'false'
+os.environ['SWEEP_AUTO_INTERVAL'] = '0'
+os.environ['KEYWORD_CACHE_ENABLED'] = 'false'
+
+import app as app_module
+from models import db
+
+PNG_BYTES = b'\x89PNG\r\n\x1a\n' + b'\x00' * 120
+
+
+class FakeCloudStorage:
+    """记录上传和删除的对象键，不访问COS"""
+
+    def __init__(self):
+        self.objects = {}
+        self.deleted = []
+
+    def upload_file(self, file_obj, file_extension, size=None, content_type=None):
+        filename = f"materials/{len(self.objects) + 1}{file_extension}"
+        self.objects[filename] = file_obj.read()
+        return {'success': True, 'filename': filename, 'file_url': f"https://cos.test/{filename}"}
+
+    def upload_bytes(self, filename, data, content_type=None):
+        self.objects[filename] = data
+        return f"https://cos.test/{filename}"
+
+    def delete_file(self, filename):
+        self.deleted.append(filename)
+        return True
+
+    def delete_files(self, filenames):
+        self.deleted.extend(filenames)
+        return {'deleted': len(filenames), 'failed': []}
+
+
+class Unavailable:
+    """未配置的服务（与初始化失败的 LazyService 一样为假值）"""
+
+    def __bool__(self):
+        return False
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(app_module, 'cloud_storage', FakeCloudStorage())
+    # 没有大模型时使用备用关键词
+    monkeypatch.setattr(app_module, 'ai_generator', Unavailable())
+    monkeypatch.setattr(app_module.derivative_generator, 'generate', lambda data: {})
+    # 每个测试重建数据库后版本号从头开始，响应缓存不能沿用上一个测试的结果
+    monkeypatch.setattr(app_module.response_cache, '_entries', OrderedDict())
+    monkeypatch.setattr(app_module.response_cache, '_bytes', 0)
+
+    flask_app = app_module.app
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,100 @@
+import pytest
+
+import utils.ark_client as ark_client
+from utils.ark_client import ArkGovernor, CallRejectedError
+
+
+class CountingBucket:
+    def __init__(self, tokens=100):
+        self.tokens = tokens
+        self.acquired = 0
+
+    def acquire(self, timeout):
+        if self.acquired >= self.tokens:
+            return False
+        self.acquired += 1
+        return True
+
+
+class Throttled(Exception):
+    status_code = 429
+
+
+@pytest.fixture
+def governor(monkeypatch):
+    governor = ArkGovernor()
+    governor.bucket = CountingBucket()
+    governor.max_retries = 2
+    sleeps = []
+    # 退避期间记录占用的并发名额
+    monkeypatch.setattr(ark_client.time, 'sleep', lambda delay: sleeps.append(governor.in_flight))
+    governor.sleeps = sleeps
+    return governor
+
+
+def test_every_attempt_takes_a_token(governor):
+    attempts = []
+
+    def create(**kwargs):
+        attempts.append(kwargs)
+        if len(attempts) < 3:
+            raise Throttled('too many requests')
+        return 'ok'
+
+    assert governor.call(create, {'model': 'm'}) == 'ok'
+    assert len(attempts) == 3
+    assert governor.bucket.acquired == 3
+    assert governor.state()['retries'] == 2
+
+
+def test_backoff_releases_the_concurrency_slot(governor):
+    def create(**kwargs):
+        raise Throttled('too many requests')
+
+    with pytest.raises(Throttled):
+        governor.call(create, {})
+
+    assert governor.sleeps == [0, 0]
+    assert governor.in_flight == 0
+    assert governor.breaker.failures == 1
+
+
+def test_retry_stops_when_the_bucket_is_empty(governor):
+    governor.bucket = CountingBucket(tokens=1)
+    calls = []
+
+    def create(**kwargs):
+        calls.append(1)
+        raise Throttled('too many requests')
+
+    # 重试取不到令牌时按最后一次调用的错误结束
+    with pytest.raises(Throttled):
+        governor.call(create, {})
+
+    assert len(calls) == 1
+    assert governor.state()['rejected'] == 1
+    assert governor.breaker.failures == 1
+
+
+def test_rejected_first_attempt_is_not_a_call(governor):
+    governor.bucket = CountingBucket(tokens=0)
+
+    with pytest.raises(CallRejectedError):
+        governor.call(lambda **kwargs: 'ok', {})
+
+    assert governor.state()['calls'] == 0
+    assert governor.breaker.failures == 0
+
+
+def test_request_errors_are_not_retried(governor):
+    class BadRequest(Exception):
+        status_code = 400
+
+    def create(**kwargs):
+        raise BadRequest('image not reachable')
+
+    with pytest.raises(BadRequest):
+        governor.call(create, {})
+
+    assert governor.bucket.acquired == 1
+    assert governor.breaker.failures == 0
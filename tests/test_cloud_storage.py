@@ -0,0 +1,88 @@
+import io
+import threading
+
+import pytest
+
+import utils.cloud_storage as cloud_storage_module
+from config import Config
+from utils.cloud_storage import CloudStorage
+
+
+class FakeCosClient:
+    """代替 CosS3Client：分块保存在内存中，可指定某个分块前几次上传失败"""
+
+    def __init__(self, config=None):
+        self.parts = {}
+        self.completed = None
+        self.aborted = []
+        self.failures = {}
+        self.lock = threading.Lock()
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        return {'UploadId': 'upload-1'}
+
+    def upload_part(self, Bucket, Key, Body, PartNumber, UploadId):
+        with self.lock:
+            if self.failures.get(PartNumber):
+                self.failures[PartNumber] -= 1
+                raise ConnectionError(f'分块 {PartNumber} 连接中断')
+            self.parts[PartNumber] = Body
+        return {'ETag': f'etag-{PartNumber}'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed = MultipartUpload['Part']
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(UploadId)
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    monkeypatch.setattr(Config, 'COS_SECRET_ID', 'id')
+    monkeypatch.setattr(Config, 'COS_SECRET_KEY', 'key')
+    monkeypatch.setattr(Config, 'COS_BUCKET', 'bucket-1250000000')
+    monkeypatch.setattr(Config, 'COS_PART_SIZE', 4)
+    monkeypatch.setattr(Config, 'COS_PART_WORKERS', 2)
+    monkeypatch.setattr(Config, 'COS_PART_RETRIES', 3)
+    monkeypatch.setattr(cloud_storage_module, 'CosS3Client', FakeCosClient)
+    # 重试的退避等待不需要真的睡眠
+    monkeypatch.setattr(cloud_storage_module.time, 'sleep', lambda seconds: None)
+    return CloudStorage()
+
+
+def test_multipart_upload_splits_stream_into_parts(storage):
+    data = b'0123456789'
+
+    result = storage.upload_file_multipart(io.BytesIO(data), '.mp4', 'video/mp4')
+
+    assert result['success'] is True
+    assert result['filename'].endswith('.mp4')
+    assert storage.client.parts == {1: b'0123', 2: b'4567', 3: b'89'}
+    assert storage.client.completed == [{'PartNumber': n, 'ETag': f'etag-{n}'} for n in (1, 2, 3)]
+
+
+def test_failed_part_is_retried_alone(storage):
+    storage.client.failures = {2: 2}
+
+    result = storage.upload_file_multipart(io.BytesIO(b'0123456789'), '.mp4')
+
+    assert result['success'] is True
+    assert b''.join(storage.client.parts[n] for n in (1, 2, 3)) == b'0123456789'
+    assert storage.client.aborted == []
+
+
+def test_part_failing_every_retry_aborts_the_upload(storage):
+    storage.client.failures = {1: 3}
+
+    result = storage.upload_file_multipart(io.BytesIO(b'0123456789'), '.mp4')
+
+    assert result['success'] is False
+    assert storage.client.completed is None
+    assert storage.client.aborted == ['upload-1']
+
+
+def test_empty_stream_aborts_the_upload(storage):
+    result = storage.upload_file_multipart(io.BytesIO(b''), '.mp4')
+
+    assert result['success'] is False
+    assert storage.client.aborted == ['upload-1']
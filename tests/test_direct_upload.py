@@ -0,0 +1,83 @@
+import pytest
+
+import app as app_module
+from conftest import FakeCloudStorage
+
+MB = 1024 * 1024
+
+
+class FakeDirectUploadStorage(FakeCloudStorage):
+    """记录发起和中止的分块上传，预签名地址为假地址"""
+
+    multipart_threshold = 8 * MB
+    part_size = 8 * MB
+
+    def __init__(self, fail_presign_part=False):
+        super().__init__()
+        self.fail_presign_part = fail_presign_part
+        self.created = []
+        self.aborted = []
+
+    def new_object_key(self, file_extension):
+        return f"materials/{len(self.created) + len(self.objects) + 1}{file_extension}"
+
+    def presign_put(self, filename, expires=None):
+        return f"https://cos.test/{filename}?sign=put"
+
+    def create_multipart(self, filename):
+        upload_id = f"upload-{len(self.created) + 1}"
+        self.created.append((filename, upload_id))
+        return upload_id
+
+    def presign_part(self, filename, upload_id, part_number, expires=None):
+        if self.fail_presign_part:
+            raise RuntimeError('签名服务不可用')
+        return f"https://cos.test/{filename}?partNumber={part_number}&uploadId={upload_id}"
+
+    def abort_multipart(self, filename, upload_id):
+        self.aborted.append((filename, upload_id))
+
+
+@pytest.fixture
+def storage(app, monkeypatch):
+    storage = FakeDirectUploadStorage()
+    monkeypatch.setattr(app_module, 'cloud_storage', storage)
+    return storage
+
+
+def test_presign_returns_put_and_part_urls(client, storage):
+    response = client.post('/api/uploads/presign', json={'files': [
+        {'filename': 'a.jpg', 'size': 100},
+        {'filename': 'b.mp4', 'size': 20 * MB},
+    ]})
+
+    uploads = response.get_json()['uploads']
+    assert response.status_code == 200
+    assert 'url' in uploads[0] and 'parts' not in uploads[0]
+    assert [part['part_number'] for part in uploads[1]['parts']] == [1, 2, 3]
+    assert all(upload['token'] for upload in uploads)
+    assert len(storage.created) == 1
+
+
+@pytest.mark.parametrize('bad_item, status', [
+    ({'filename': 'c.jpg'}, 400),
+    ({'filename': 'c.jpg', 'size': 'abc'}, 400),
+    ({'filename': 'c.jpg', 'size': 10 ** 12}, 413),
+])
+def test_invalid_item_is_rejected_before_any_multipart_upload(client, storage, bad_item, status):
+    response = client.post('/api/uploads/presign', json={'files': [
+        {'filename': 'big.mp4', 'size': 20 * MB},
+        bad_item,
+    ]})
+
+    assert response.status_code == status
+    assert storage.created == []
+
+
+def test_failure_after_create_aborts_multipart_uploads(client, storage):
+    storage.fail_presign_part = True
+
+    response = client.post('/api/uploads/presign', json={'files': [{'filename': 'big.mp4', 'size': 20 * MB}]})
+
+    assert response.status_code == 500
+    assert storage.aborted == storage.created and len(storage.created) == 1
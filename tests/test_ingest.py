@@ -0,0 +1,68 @@
+import io
+import hashlib
+
+import app as app_module
+from conftest import PNG_BYTES
+from utils.ingest import IngestStream, sniff_mime_type
+
+
+def test_sniff_recognizes_magic_bytes():
+    assert sniff_mime_type(b'\xff\xd8\xff\xe0' + b'\x00' * 60) == 'image/jpeg'
+    assert sniff_mime_type(PNG_BYTES) == 'image/png'
+    assert sniff_mime_type(b'\x00\x00\x00\x18ftypmp42' + b'\x00' * 52) == 'video/mp4'
+    assert sniff_mime_type(b'\x00\x00\x00\x18ftypheic' + b'\x00' * 52) == 'image/heic'
+    bmp_header = b'BM' + (1078).to_bytes(4, 'little') + b'\x00' * 8 + (40).to_bytes(4, 'little')
+    assert sniff_mime_type(bmp_header + b'\x00' * 46) == 'image/bmp'
+
+
+def test_sniff_rejects_unknown_content():
+    assert sniff_mime_type(b'<html><body>not an image</body></html>') is None
+    assert sniff_mime_type(b'') is None
+    # 以 "BM" 开头但没有合法 DIB 信息头的文本，以及截断的位图头
+    assert sniff_mime_type(b'BMW owners club meeting notes, spring 2026') is None
+    assert sniff_mime_type(b'BM' + b'\x00' * 12 + b'\x28') is None
+
+
+def test_ingest_stream_hashes_while_passing_data_through():
+    data = PNG_BYTES * 3
+    stream = IngestStream(io.BytesIO(data))
+    assert (stream.file_type, stream.extension) == ('image', '.png')
+    assert stream.length == len(data)
+
+    assert stream.read(5) + stream.read() == data
+    assert stream.size == len(data)
+
+    assert stream.hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+def test_upload_rejects_spoofed_extension(client):
+    response = client.post('/api/upload', data={
+        'files': [(io.BytesIO(b'#!/bin/sh\necho not a photo\n' * 4), 'peach.jpg')]
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == [{'filename': 'peach.jpg', 'error': '不支持的文件类型'}]
+    assert app_module.cloud_storage.objects == {}
+
+
+def test_upload_reports_rejected_files_next_to_accepted_ones(client):
+    response = client.post('/api/upload', data={
+        'files': [(io.BytesIO(PNG_BYTES), 'peach.png'), (io.BytesIO(b'plain text' * 10), 'fake.png')]
+    }, content_type='multipart/form-data')
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert [material['filename'] for material in body['materials']] == ['peach.png']
+    assert [error['filename'] for error in body['errors']] == ['fake.png']
+
+
+def test_same_file_twice_in_one_request_is_uploaded_once(client):
+    response = client.post('/api/upload', data={
+        'files': [(io.BytesIO(PNG_BYTES), 'a.png'), (io.BytesIO(PNG_BYTES), 'b.png')]
+    }, content_type='multipart/form-data')
+
+    materials = response.get_json()['materials']
+    assert response.status_code == 200
+    assert len(app_module.cloud_storage.objects) == 1
+    assert materials[0]['file_path'] == materials[1]['file_path']
+    assert materials[0]['ai_keywords'] == materials[1]['ai_keywords']
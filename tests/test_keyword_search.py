@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Material, DataVersion
+
+
+@pytest.fixture
+def materials(app):
+    """三个已索引关键词的素材，返回 {文件名: id}"""
+    keywords = {
+        'a.jpg': '桃子，果园，春天',
+        'b.jpg': '桃子，采摘',
+        'c.jpg': '果园，春天',
+    }
+    started = datetime(2026, 5, 1, 8, 0, 0)
+    ids = {}
+    with app.app_context():
+        for i, (filename, ai_keywords) in enumerate(keywords.items()):
+            material = Material(filename=filename, file_type='image', file_path=f'https://cos.test/{filename}',
+                                file_size=100, ai_keywords=ai_keywords, ai_status='done',
+                                upload_time=started + timedelta(minutes=i))
+            db.session.add(material)
+            db.session.flush()
+            material.sync_keyword_index()
+            ids[filename] = material.id
+        DataVersion.bump()
+        db.session.commit()
+    return ids
+
+
+def _filenames(response):
+    return [material['filename'] for material in response.get_json()['materials']]
+
+
+def test_search_and_requires_every_keyword(client, materials):
+    response = client.get('/api/materials/search?kw=果园,春天')
+
+    assert response.status_code == 200
+    # 按上传时间倒序
+    assert _filenames(response) == ['c.jpg', 'a.jpg']
+    assert response.get_json()['op'] == 'and'
+
+
+def test_search_or_matches_any_keyword(client, materials):
+    response = client.get('/api/materials/search?kw=采摘,春天&op=or')
+
+    assert response.status_code == 200
+    assert _filenames(response) == ['c.jpg', 'b.jpg', 'a.jpg']
+
+
+def test_search_pages_with_cursor(client, materials):
+    first = client.get('/api/materials/search?kw=桃子,果园,春天,采摘&op=or&per_page=2').get_json()
+    assert [material['filename'] for material in first['materials']] == ['c.jpg', 'b.jpg']
+
+    second = client.get(f"/api/materials/search?kw=桃子,果园,春天,采摘&op=or&per_page=2&cursor={first['next_cursor']}")
+    assert _filenames(second) == ['a.jpg']
+    assert second.get_json()['next_cursor'] is None
+
+
+def test_search_projects_fields(client, materials):
+    response = client.get('/api/materials/search?kw=采摘&fields=filename')
+
+    assert response.get_json()['materials'] == [
+        {'id': materials['b.jpg'], 'filename': 'b.jpg', 'upload_time': '2026-05-01T08:01:00'}
+    ]
+
+
+def test_search_without_matches_is_empty(client, materials):
+    response = client.get('/api/materials/search?kw=苹果')
+
+    assert response.status_code == 200
+    assert response.get_json()['materials'] == []
+    assert response.get_json()['next_cursor'] is None
+
+
+@pytest.mark.parametrize('query', [
+    'kw=',
+    'kw=桃子&op=xor',
+    'kw=桃子&fields=password',
+    'kw=桃子&cursor=not-a-cursor',
+])
+def test_search_rejects_bad_params(client, materials, query):
+    response = client.get(f'/api/materials/search?{query}')
+
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_facets_count_every_keyword(client, materials):
+    response = client.get('/api/keywords/facets')
+
+    assert response.status_code == 200
+    assert response.get_json()['facets'] == [
+        {'keyword': '春天', 'count': 2},
+        {'keyword': '果园', 'count': 2},
+        {'keyword': '桃子', 'count': 2},
+        {'keyword': '采摘', 'count': 1},
+    ]
+
+
+def test_facets_narrow_by_selected_keywords(client, materials):
+    response = client.get('/api/keywords/facets?kw=桃子')
+
+    body = response.get_json()
+    assert body['selected'] == ['桃子']
+    assert body['facets'] == [
+        {'keyword': '春天', 'count': 1},
+        {'keyword': '果园', 'count': 1},
+        {'keyword': '采摘', 'count': 1},
+    ]
+
+
+def test_facets_limit_is_clamped(client, materials):
+    assert len(client.get('/api/keywords/facets?limit=2').get_json()['facets']) == 2
+    # limit 小于 1 时按 1 处理
+    assert len(client.get('/api/keywords/facets?limit=-5').get_json()['facets']) == 1
+    # 非数字的 limit 使用默认值
+    assert client.get('/api/keywords/facets?limit=abc').status_code == 200
+
+
+def test_facets_follow_deletes(client, materials):
+    client.delete(f"/api/materials/{materials['b.jpg']}")
+
+    facets = client.get('/api/keywords/facets').get_json()['facets']
+    assert {'keyword': '采摘', 'count': 1} not in facets
+    assert {'keyword': '桃子', 'count': 1} in facets
+
+
+def test_facets_without_materials_are_empty(client):
+    response = client.get('/api/keywords/facets?kw=桃子')
+
+    assert response.status_code == 200
+    assert response.get_json()['facets'] == []
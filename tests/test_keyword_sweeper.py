@@ -0,0 +1,144 @@
+from datetime import datetime, timedelta
+
+from models import db, Material, SweepRun, DataVersion
+from utils.background_worker import claim_first
+from utils.keyword_sweeper import KeywordSweeper
+
+
+def _sweeper(app):
+    return KeywordSweeper(app, lambda materials, model: None)
+
+
+def test_running_sweep_is_claimed_only_once(app):
+    sweeper = _sweeper(app)
+    with app.app_context():
+        run_id = sweeper.start_run('failed').id
+
+        first = sweeper._claim()
+        assert first is not None and first.id == run_id
+        # 租约未过期，其他线程领取不到
+        assert sweeper._claim() is None
+
+
+def test_claim_race_on_the_same_candidates(app):
+    """两个线程查询到相同的候选任务后同时领取，条件更新只让其中一个成功"""
+    with app.app_context():
+        run = SweepRun(mode='failed', model='test-model')
+        db.session.add(run)
+        db.session.commit()
+
+        now = datetime.utcnow()
+        claimable = db.and_(
+            SweepRun.status == 'running',
+            db.or_(SweepRun.lease_until.is_(None), SweepRun.lease_until < now)
+        )
+        candidates = SweepRun.query.with_entities(SweepRun.id).filter(claimable).all()
+        values = {'lease_until': now + timedelta(minutes=5)}
+
+        assert claim_first(SweepRun, candidates, claimable, values) == run.id
+        assert claim_first(SweepRun, candidates, claimable, values) is None
+
+
+def test_expired_lease_can_be_reclaimed(app):
+    sweeper = _sweeper(app)
+    with app.app_context():
+        run = sweeper.start_run('failed')
+        run.lease_until = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+
+        assert sweeper._claim().id == run.id
+
+
+def test_paused_sweep_is_not_claimed(app):
+    sweeper = _sweeper(app)
+    with app.app_context():
+        run = sweeper.start_run('failed')
+        sweeper.set_status(run.id, 'paused')
+
+        assert sweeper._claim() is None
+
+
+def _failed_material(app, attempts=1):
+    with app.app_context():
+        material = Material(filename='a.jpg', file_type='image', file_path='https://cos.test/a.jpg',
+                            file_size=100, ai_keywords='备用', ai_status='failed', ai_attempts=attempts)
+        db.session.add(material)
+        db.session.commit()
+        return material.id
+
+
+def test_batch_without_model_call_is_left_unchanged(app):
+    material_id = _failed_material(app)
+
+    def unavailable(materials, model):
+        for material in materials:
+            material.record_analysis({'success': False, 'ai_keywords': '通用', 'attempted': False}, model)
+        return list(materials)
+
+    sweeper = KeywordSweeper(app, unavailable)
+    with app.app_context():
+        run_id = sweeper.start_run('failed').id
+
+    assert sweeper.run_once(run_id) is False
+
+    with app.app_context():
+        material = db.session.get(Material, material_id)
+        run = db.session.get(SweepRun, run_id)
+        assert (material.ai_keywords, material.ai_attempts) == ('备用', 1)
+        assert (run.cursor_id, run.processed, run.lease_until) == (None, 0, None)
+
+
+def test_batch_with_model_call_counts_an_attempt(app):
+    material_id = _failed_material(app)
+
+    def analyze(materials, model):
+        for material in materials:
+            material.record_analysis({'success': True, 'ai_keywords': '桃子，果园'}, model)
+        return []
+
+    sweeper = KeywordSweeper(app, analyze)
+    with app.app_context():
+        run_id = sweeper.start_run('failed').id
+
+    assert sweeper.run_once(run_id) is True
+
+    with app.app_context():
+        material = db.session.get(Material, material_id)
+        assert (material.ai_status, material.ai_attempts) == ('done', 2)
+        assert db.session.get(SweepRun, run_id).processed == 1
+
+
+def test_unavailable_model_does_not_use_up_attempts(app):
+    import app as app_module
+
+    material_id = _failed_material(app, attempts=0)
+    with app.app_context():
+        material = db.session.get(Material, material_id)
+        # conftest 中 ai_generator 不可用
+        assert app_module._generate_keywords([material]) == [material]
+        assert material.ai_attempts == 0
+
+
+def test_auto_schedule_is_claimed_once(app):
+    sweeper = _sweeper(app)
+    sweeper.auto_interval = 3600
+    with app.app_context():
+        assert DataVersion.claim_interval('sweep_auto', timedelta(hours=1)) is True
+        # 另一个 worker 在同一时间窗口内领取不到
+        assert DataVersion.claim_interval('sweep_auto', timedelta(hours=1)) is False
+
+        sweeper._schedule_auto()
+        assert SweepRun.query.count() == 0
+
+
+def test_auto_schedule_creates_one_run(app):
+    sweepers = [_sweeper(app), _sweeper(app)]
+    with app.app_context():
+        for sweeper in sweepers:
+            sweeper.auto_interval = 3600
+            sweeper._schedule_auto()
+            # 结束刚创建的任务，第二个 worker 只能靠调度记录判断本时间窗口已经创建过
+            SweepRun.query.update({'status': 'done'})
+            db.session.commit()
+
+        assert SweepRun.query.filter_by(auto=True).count() == 1
@@ -0,0 +1,62 @@
+import io
+
+from conftest import PNG_BYTES
+from models import db, MaterialStat
+
+
+def _upload(client, *files):
+    response = client.post('/api/upload', data={
+        'files': [(io.BytesIO(data), filename) for filename, data in files]
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200
+    return response.get_json()['materials']
+
+
+def _totals():
+    """(素材数, 字节数, 备用关键词数)"""
+    stats = MaterialStat.query.all()
+    return (sum(stat.material_count for stat in stats),
+            sum(stat.total_bytes for stat in stats),
+            sum(stat.fallback_count for stat in stats))
+
+
+def test_upload_increments_stats(client, app):
+    second = PNG_BYTES + b'\x01' * 10
+    _upload(client, ('a.png', PNG_BYTES), ('b.png', second))
+
+    with app.app_context():
+        # 没有大模型时保存的是备用关键词，计入 fallback_count
+        assert _totals() == (2, len(PNG_BYTES) + len(second), 2)
+
+
+def test_single_delete_decrements_stats(client, app):
+    materials = _upload(client, ('a.png', PNG_BYTES), ('b.png', PNG_BYTES + b'\x01'))
+
+    response = client.delete(f"/api/materials/{materials[0]['id']}")
+    assert response.status_code == 200
+
+    with app.app_context():
+        assert _totals() == (1, len(PNG_BYTES) + 1, 1)
+
+
+def test_batch_delete_decrements_stats(client, app):
+    materials = _upload(client, ('a.png', PNG_BYTES), ('b.png', PNG_BYTES + b'\x01'))
+
+    response = client.delete('/api/materials/batch', json={
+        'material_ids': [material['id'] for material in materials]
+    })
+    assert response.status_code == 200
+
+    with app.app_context():
+        assert _totals() == (0, 0, 0)
+
+
+def test_rebuild_matches_incremental_stats(client, app):
+    materials = _upload(client, ('a.png', PNG_BYTES), ('b.png', PNG_BYTES + b'\x01'))
+    client.delete(f"/api/materials/{materials[1]['id']}")
+
+    with app.app_context():
+        incremental = _totals()
+        MaterialStat.refresh()
+        db.session.commit()
+        assert _totals() == incremental
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Material, DataVersion
+
+
+@pytest.fixture
+def materials(app):
+    """三个上传时间依次递增的素材"""
+    started = datetime(2026, 5, 1, 8, 0, 0)
+    with app.app_context():
+        for i in range(3):
+            db.session.add(Material(filename=f'{i}.jpg', file_type='image', file_path=f'https://cos.test/{i}.jpg',
+                                    file_size=100, ai_keywords='桃子', upload_time=started + timedelta(minutes=i)))
+        DataVersion.bump()
+        db.session.commit()
+
+
+def test_fields_projection_pages_by_number(client, materials):
+    body = client.get('/api/materials?fields=filename&per_page=2&page=2').get_json()
+
+    assert [material['filename'] for material in body['materials']] == ['0.jpg']
+    assert (body['total'], body['pages'], body['current_page']) == (3, 2, 2)
+    assert set(body['materials'][0]) == {'id', 'filename', 'upload_time'}
+
+
+@pytest.mark.parametrize('query, per_page_used, page', [
+    ('per_page=-1', 1, 1),
+    ('per_page=0', 1, 1),
+    ('per_page=1000', 100, 1),
+    ('per_page=2&page=-3', 2, 1),
+])
+def test_fields_projection_clamps_paging(client, materials, query, per_page_used, page):
+    response = client.get(f'/api/materials?fields=filename&{query}')
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert len(body['materials']) == min(per_page_used, 3)
+    assert body['pages'] == -(-3 // per_page_used)
+    assert body['current_page'] == page
+
+
+def test_unknown_field_is_rejected(client, materials):
+    assert client.get('/api/materials?fields=secret').status_code == 400
@@ -0,0 +1,309 @@
+import os
+import time
+import random
+import logging
+import threading
+from types import SimpleNamespace
+from config import Config
+from utils.metrics import metrics
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+class CallRejectedError(Exception):
+    """请求被本地保护拦截，没有发给豆包（调用方不应把它当作一次分析尝试）"""
+
+
+class CircuitOpenError(CallRejectedError):
+    """熔断器打开期间直接拒绝请求"""
+
+
+class QueueTimeoutError(CallRejectedError, TimeoutError):
+    """等待限流令牌或并发名额超时"""
+
+
+def is_retryable(error):
+    """超时、连接错误、限流和服务端错误可以重试，请求本身有问题（4xx）则不重试"""
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    name = type(error).__name__
+    return isinstance(error, (TimeoutError, ConnectionError)) or 'Timeout' in name or 'Connection' in name
+
+
+class TokenBucket:
+    """令牌桶限流：每秒补充 rate 个令牌，最多积攒 capacity 个"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        """取一个令牌，超时仍未取到时返回 False"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class RedisTokenBucket:
+    """Redis 中的令牌桶：所有 worker 进程共用同一个桶，ARK_RATE_LIMIT 即全局速率
+
+    取令牌由 Lua 脚本原子完成，时间取 Redis 服务器时间，不受各机器时钟偏差影响。
+    Redis 不可用时退回进程内令牌桶（此时速率按每个进程计算）。
+    """
+
+    SCRIPT = """
+    if redis.replicate_commands then redis.replicate_commands() end
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+    return tostring(wait)
+    """
+
+    def __init__(self, client, key, rate, capacity):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self._script = client.register_script(self.SCRIPT)
+        self._fallback = TokenBucket(rate, capacity)
+        self._failed_at = None
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            if self._failed_at is not None and time.monotonic() - self._failed_at < Config.SERVICE_RETRY_INTERVAL:
+                return self._fallback.acquire(max(0, deadline - time.monotonic()))
+            try:
+                wait = float(self._script(keys=[self.key], args=[self.rate, self.capacity]))
+                self._failed_at = None
+            except Exception as e:
+                logging.warning(f"⚠️ Redis 限流不可用，暂时改用进程内限流: {e}")
+                self._failed_at = time.monotonic()
+                continue
+            if wait <= 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，冷却期过后放行一个探测请求（半开）"""
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release_probe(self):
+        """探测请求未真正发出（如排队超时）时归还探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logging.info("✅ 豆包服务恢复，熔断器关闭")
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logging.warning(f"⚠️ 豆包服务连续失败 {self.failures} 次，熔断器打开")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class ArkGovernor:
+    """豆包调用的限流、并发上限、超时、重试和熔断，同一进程内所有客户端和模型共用一份
+
+    配置 ARK_RATE_LIMIT_REDIS_URL 时令牌桶放在 Redis 中，所有 worker 合计不超过 ARK_RATE_LIMIT；
+    未配置时限流按进程计算，总速率约为 ARK_RATE_LIMIT × worker 数。
+    并发上限和熔断器始终按进程计算。所有保护措施失败时抛出异常，由生成器退回备用关键词。
+    """
+
+    def __init__(self):
+        self.timeout = Config.ARK_TIMEOUT
+        self.max_retries = Config.ARK_MAX_RETRIES
+        self.bucket = self._create_bucket()
+        self.breaker = CircuitBreaker(Config.ARK_BREAKER_THRESHOLD, Config.ARK_BREAKER_RESET)
+        self.max_concurrency = Config.ARK_MAX_CONCURRENCY
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+
+    @staticmethod
+    def _create_bucket():
+        if Config.ARK_RATE_LIMIT_REDIS_URL:
+            if redis is None:
+                logging.warning("未安装 redis，豆包限流按进程计算")
+            else:
+                return RedisTokenBucket(redis.Redis.from_url(Config.ARK_RATE_LIMIT_REDIS_URL),
+                                        'ark:rate_limit', Config.ARK_RATE_LIMIT, Config.ARK_RATE_BURST)
+        return TokenBucket(Config.ARK_RATE_LIMIT, Config.ARK_RATE_BURST)
+
+    def call(self, create, kwargs):
+        """在各项保护下调用 create(**kwargs)
+
+        每次尝试（包括重试）都要取一个令牌和一个并发名额，重试不会绕过限流；
+        退避等待期间归还并发名额，不占着名额睡眠。
+        """
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise CircuitOpenError("豆包服务熔断中，暂不调用")
+        return self._call_with_retries(create, kwargs)
+
+    def state(self):
+        with self._lock:
+            return {
+                'circuit': self.breaker.state,
+                'consecutive_failures': self.breaker.failures,
+                'rate_limit_scope': 'global' if isinstance(self.bucket, RedisTokenBucket) else 'worker',
+                'in_flight': self.in_flight,
+                'max_concurrency': self.max_concurrency,
+                'calls': self.calls,
+                'retries': self.retries,
+                'failures': self.failures,
+                'rejected': self.rejected
+            }
+
+    def _acquire(self):
+        """取一个限流令牌和一个并发名额，排队等待的时间也计入超时，避免服务变慢时请求线程无限堆积"""
+        if not self.bucket.acquire(self.timeout):
+            raise QueueTimeoutError("等待限流令牌超时")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise QueueTimeoutError("等待并发名额超时")
+
+    def _call_with_retries(self, create, kwargs):
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._acquire()
+            except QueueTimeoutError:
+                self._count('rejected')
+                if last_error is None:
+                    # 请求没有发出，归还半开状态的探测名额
+                    self.breaker.release_probe()
+                    raise
+                # 之前的尝试都已失败，按最后一次调用的错误结束
+                self._count('failures')
+                self.breaker.record_failure()
+                raise last_error
+
+            try:
+                with self._lock:
+                    self.in_flight += 1
+                self._count('calls')
+                with metrics.timer('suyuan_stage_seconds', stage='ai_call'):
+                    response = create(timeout=self.timeout, **kwargs)
+                self.breaker.record_success()
+                return response
+            except Exception as e:
+                if not is_retryable(e):
+                    # 请求本身的问题（如图片无法访问）说明服务能正常响应，不计入熔断
+                    self._count('failures')
+                    self.breaker.record_success()
+                    raise
+                if attempt == self.max_retries:
+                    self._count('failures')
+                    self.breaker.record_failure()
+                    raise
+                last_error = e
+                # 指数退避 + 全抖动
+                delay = random.uniform(0, Config.ARK_RETRY_BASE_DELAY * 2 ** attempt)
+                logging.warning(f"豆包调用失败（第 {attempt + 1} 次），{delay:.2f}s 后重试: {e}")
+                self._count('retries')
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+                self._slots.release()
+            time.sleep(delay)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+_governor = None
+_governor_pid = None
+_governor_lock = threading.Lock()
+
+def get_governor():
+    """当前进程共用的 ArkGovernor（fork 出的子进程重新创建，不共用锁和连接）"""
+    global _governor, _governor_pid
+    with _governor_lock:
+        if _governor is None or _governor_pid != os.getpid():
+            _governor = ArkGovernor()
+            _governor_pid = os.getpid()
+        return _governor
+
+
+class ResilientArkClient:
+    """给豆包 Ark 客户端加上 ArkGovernor 的保护
+
+    对外保持 client.chat.completions.create(...) 的调用方式，DoubaoAIGenerator 无需改动调用代码。
+    """
+
+    def __init__(self, client, governor=None):
+        self._client = client
+        self.governor = governor or get_governor()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        return self.governor.call(self._client.chat.completions.create, kwargs)
+
+    def state(self):
+        return self.governor.state()
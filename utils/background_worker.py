@@ -0,0 +1,81 @@
+import os
+import abc
+import logging
+import threading
+from models import db
+
+class BackgroundWorker(abc.ABC):
+    """基于数据库表的后台工作线程（关键词任务队列、关键词补跑共用）
+
+    子类实现 run_once()：领取并处理一项工作，没有可领取的工作时返回 False。
+    有工作时间隔 busy_interval 秒继续领取，空闲时等待 poll_interval 秒或被 notify() 唤醒。
+    Web 进程和独立 worker.py 可以同时运行，靠 claim_first 的条件更新保证同一行只被一个线程领取。
+    """
+
+    thread_name = 'background-worker'
+    description = '后台工作'
+
+    def __init__(self, app, workers=1, poll_interval=1, busy_interval=0):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.busy_interval = busy_interval
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+
+    def notify(self):
+        """唤醒空闲的工作线程"""
+        self._wakeup.set()
+
+    def ensure_started(self):
+        """启动工作线程（幂等；fork 后的子进程会重新启动自己的线程）"""
+        if self._pid == os.getpid() and self._threads:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._threads:
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._loop, name=f"{self.thread_name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logging.info(f"🧵 已启动 {self.workers} 个{self.description}线程")
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    @abc.abstractmethod
+    def run_once(self):
+        """领取并处理一项工作，返回是否领取到了工作"""
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                if self.run_once():
+                    self._stop.wait(self.busy_interval)
+                    continue
+            except Exception as e:
+                logging.error(f"{self.description}异常: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+
+def claim_first(model, candidate_ids, claimable, values):
+    """依次尝试领取候选行，返回领取到的 id，都已被其他线程领取时返回 None
+
+    条件更新：只有该行仍满足 claimable 时才写入 values，同一行只会被一个线程领取。
+    """
+    for (row_id,) in candidate_ids:
+        claimed = model.query.filter(model.id == row_id, claimable)\
+            .update(values, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return row_id
+    return None
@@ -1,6 +1,12 @@
 import uuid
+import time
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from qcloud_cos import CosConfig, CosS3Client
+from qcloud_cos.cos_exception import CosServiceError
 from config import Config
+from utils.metrics import metrics
 import logging
 
 class CloudStorage:
@@ -11,31 +17,55 @@ class CloudStorage:
         self.config = CosConfig(
             Region=Config.COS_REGION,
             SecretId=Config.COS_SECRET_ID,
-            SecretKey=Config.COS_SECRET_KEY
+            SecretKey=Config.COS_SECRET_KEY,
+            Scheme=Config.COS_SCHEME,
+            Domain=Config.COS_DOMAIN,
+            PoolConnections=Config.COS_POOL_SIZE,
+            PoolMaxSize=Config.COS_POOL_SIZE
         )
         self.client = CosS3Client(self.config)
         self.bucket = Config.COS_BUCKET
+        self.multipart_threshold = Config.COS_MULTIPART_THRESHOLD
+        self.part_size = Config.COS_PART_SIZE
+        self.part_workers = Config.COS_PART_WORKERS
+        self.part_retries = Config.COS_PART_RETRIES
     
-    def upload_file(self, file_obj, file_extension):
-        """上传文件到腾讯云COS"""
+    def file_url(self, filename):
+        """对象键对应的访问URL"""
+        if Config.COS_DOMAIN:
+            return f"{Config.COS_SCHEME}://{Config.COS_DOMAIN}/{filename}"
+        return f"https://{self.bucket}.cos.{Config.COS_REGION}.myqcloud.com/{filename}"
+    
+    def upload_file(self, file_obj, file_extension, size=None, content_type=None):
+        """上传文件到腾讯云COS（超过分块阈值的文件自动走分块上传）
+
+        size 未传入时通过 seek 获取文件大小；content_type 为对象的 Content-Type
+        """
         try:
-            # 生成唯一文件名
-            filename = f"materials/{uuid.uuid4().hex}{file_extension}"
-            
             # 重置文件指针
-            if hasattr(file_obj, 'seek'):
+            if size is None and hasattr(file_obj, 'seek'):
+                file_obj.seek(0, 2)
+                size = file_obj.tell()
                 file_obj.seek(0)
+            if size is not None and size > self.multipart_threshold:
+                return self.upload_file_multipart(file_obj, file_extension, content_type)
+            
+            # 生成唯一文件名
+            filename = self.new_object_key(file_extension)
             
             # 上传文件
-            response = self.client.put_object(
-                Bucket=self.bucket,
-                Body=file_obj,
-                Key=filename,
-                EnableMD5=False
-            )
+            kwargs = {'ContentType': content_type} if content_type else {}
+            with metrics.timer('suyuan_stage_seconds', stage='cos_put'):
+                response = self.client.put_object(
+                    Bucket=self.bucket,
+                    Body=file_obj,
+                    Key=filename,
+                    EnableMD5=False,
+                    **kwargs
+                )
             
             # 返回文件URL
-            file_url = f"https://{self.bucket}.cos.{Config.COS_REGION}.myqcloud.com/{filename}"
+            file_url = self.file_url(filename)
             return {
                 'success': True,
                 'file_url': file_url,
@@ -49,14 +79,236 @@ class CloudStorage:
                 'error': str(e)
             }
     
-    def delete_file(self, filename):
-        """从云端删除文件"""
+    def upload_bytes(self, filename, data, content_type=None):
+        """以指定对象键上传一段内存数据（用于缩略图等衍生文件），返回文件URL"""
+        kwargs = {'ContentType': content_type} if content_type else {}
+        with metrics.timer('suyuan_stage_seconds', stage='cos_put'):
+            self.client.put_object(
+                Bucket=self.bucket,
+                Body=data,
+                Key=filename,
+                EnableMD5=False,
+                **kwargs
+            )
+        return self.file_url(filename)
+    
+    def upload_file_multipart(self, file_obj, file_extension, content_type=None):
+        """分块上传：边读边传，支持不可 seek 的请求流
+
+        按 part_size 顺序读取数据，由线程池并发上传各分块；同时在途的分块数
+        不超过 2 × part_workers，内存占用因此有上限。单个分块失败时只重传该分块，
+        整体失败时中止分块上传，避免COS残留碎片。
+        """
+        filename = self.new_object_key(file_extension)
+        upload_id = None
+        
         try:
-            self.client.delete_object(
+            kwargs = {'ContentType': content_type} if content_type else {}
+            response = self.client.create_multipart_upload(Bucket=self.bucket, Key=filename, **kwargs)
+            upload_id = response['UploadId']
+            
+            in_flight = threading.BoundedSemaphore(self.part_workers * 2)
+            futures = []
+            
+            with ThreadPoolExecutor(max_workers=self.part_workers) as executor:
+                part_number = 1
+                while True:
+                    in_flight.acquire()
+                    # 已有分块重试后仍失败时不再继续读取
+                    for future in futures:
+                        if future.done() and future.exception():
+                            raise future.exception()
+                    chunk = self._read_part(file_obj)
+                    if not chunk:
+                        in_flight.release()
+                        break
+                    future = executor.submit(self._upload_part, filename, upload_id, part_number, chunk)
+                    future.add_done_callback(lambda _: in_flight.release())
+                    futures.append(future)
+                    part_number += 1
+            
+            parts = [future.result() for future in futures]
+            if not parts:
+                raise ValueError("文件内容为空")
+            
+            self.client.complete_multipart_upload(
                 Bucket=self.bucket,
-                Key=filename
+                Key=filename,
+                UploadId=upload_id,
+                MultipartUpload={'Part': parts}
             )
+            logging.info(f"📦 分块上传完成: {filename}（{len(parts)} 块）")
+            
+            return {
+                'success': True,
+                'file_url': self.file_url(filename),
+                'filename': filename
+            }
+            
+        except Exception as e:
+            logging.error(f"分块上传失败: {str(e)}")
+            if upload_id:
+                self.abort_multipart(filename, upload_id)
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def _read_part(self, file_obj):
+        """读满一个分块（请求流单次 read 可能返回不足 part_size 的数据）"""
+        buffer = bytearray()
+        while len(buffer) < self.part_size:
+            data = file_obj.read(self.part_size - len(buffer))
+            if not data:
+                break
+            buffer.extend(data)
+        return bytes(buffer)
+    
+    def _upload_part(self, filename, upload_id, part_number, chunk):
+        """上传单个分块，失败时指数退避重试"""
+        for attempt in range(1, self.part_retries + 1):
+            try:
+                with metrics.timer('suyuan_stage_seconds', stage='cos_upload_part'):
+                    response = self.client.upload_part(
+                        Bucket=self.bucket,
+                        Key=filename,
+                        Body=chunk,
+                        PartNumber=part_number,
+                        UploadId=upload_id
+                    )
+                return {'PartNumber': part_number, 'ETag': response['ETag']}
+            except Exception as e:
+                if attempt == self.part_retries:
+                    raise
+                logging.warning(f"分块 {part_number} 上传失败（第 {attempt} 次），重试中: {e}")
+                time.sleep(0.5 * 2 ** (attempt - 1))
+    
+    def new_object_key(self, file_extension):
+        """生成新的对象键"""
+        return f"materials/{uuid.uuid4().hex}{file_extension}"
+    
+    def presign_put(self, filename, expires=None):
+        """客户端直传用的预签名 PUT 地址"""
+        return self.client.get_presigned_url(
+            Bucket=self.bucket,
+            Key=filename,
+            Method='PUT',
+            Expired=expires or Config.COS_PRESIGN_EXPIRES
+        )
+    
+    def create_multipart(self, filename):
+        """发起分块上传，返回 UploadId"""
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=filename)
+        return response['UploadId']
+    
+    def presign_part(self, filename, upload_id, part_number, expires=None):
+        """客户端直传单个分块用的预签名 PUT 地址"""
+        return self.client.get_presigned_url(
+            Bucket=self.bucket,
+            Key=filename,
+            Method='PUT',
+            Expired=expires or Config.COS_PRESIGN_EXPIRES,
+            Params={'partNumber': str(part_number), 'uploadId': upload_id}
+        )
+    
+    def abort_multipart(self, filename, upload_id):
+        """中止分块上传并清理已上传的分块，失败时只记录日志"""
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=filename, UploadId=upload_id)
+        except Exception as e:
+            logging.error(f"中止分块上传失败: {e}")
+    
+    def complete_multipart(self, filename, upload_id, parts):
+        """合并客户端已上传的分块，parts 为 [{'PartNumber': n, 'ETag': etag}]"""
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=filename,
+            UploadId=upload_id,
+            MultipartUpload={'Part': sorted(parts, key=lambda part: part['PartNumber'])}
+        )
+    
+    def head_file(self, filename):
+        """查询对象大小，对象不存在时返回 None"""
+        try:
+            with metrics.timer('suyuan_stage_seconds', stage='cos_head'):
+                response = self.client.head_object(Bucket=self.bucket, Key=filename)
+        except CosServiceError as e:
+            if e.get_status_code() == 404:
+                return None
+            raise
+        return {
+            'size': int(response.get('Content-Length', 0)),
+            'etag': response.get('ETag')
+        }
+    
+    def list_objects(self, prefix='materials/', page_size=1000):
+        """按对象键顺序逐页列出对象（生成器，每次只在内存中保留一页）
+
+        产出 {'key', 'size', 'last_modified'}，last_modified 为 UTC 时间（不带时区）
+        """
+        marker = ''
+        while True:
+            with metrics.timer('suyuan_stage_seconds', stage='cos_list'):
+                response = self.client.list_objects(
+                    Bucket=self.bucket,
+                    Prefix=prefix,
+                    Marker=marker,
+                    MaxKeys=page_size
+                )
+            contents = response.get('Contents', [])
+            for item in contents:
+                yield {
+                    'key': item['Key'],
+                    'size': int(item.get('Size', 0)),
+                    'last_modified': datetime.strptime(item['LastModified'][:19], '%Y-%m-%dT%H:%M:%S')
+                }
+            if response.get('IsTruncated') != 'true' or not contents:
+                return
+            marker = response.get('NextMarker') or contents[-1]['Key']
+    
+    def delete_file(self, filename):
+        """从云端删除文件"""
+        try:
+            with metrics.timer('suyuan_stage_seconds', stage='cos_delete'):
+                self.client.delete_object(
+                    Bucket=self.bucket,
+                    Key=filename
+                )
             return True
         except Exception as e:
             logging.error(f"文件删除失败: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+    
+    def delete_files(self, filenames):
+        """批量删除云端文件（COS批量删除接口每次最多1000个对象）
+
+        返回 {'deleted': 成功数, 'failed': [失败的对象键]}
+        """
+        deleted = 0
+        failed = []
+        
+        for start in range(0, len(filenames), 1000):
+            chunk = filenames[start:start + 1000]
+            try:
+                with metrics.timer('suyuan_stage_seconds', stage='cos_delete'):
+                    response = self.client.delete_objects(
+                        Bucket=self.bucket,
+                        Delete={
+                            'Object': [{'Key': key} for key in chunk],
+                            'Quiet': 'true'
+                        }
+                    )
+                # Quiet 模式下只返回删除失败的对象
+                errors = (response or {}).get('Error', [])
+                if isinstance(errors, dict):
+                    errors = [errors]
+                failed.extend(error['Key'] for error in errors)
+                deleted += len(chunk) - len(errors)
+            except Exception as e:
+                logging.error(f"批量删除文件失败: {str(e)}")
+                failed.extend(chunk)
+        
+        return {
+            'deleted': deleted,
+            'failed': failed
+        }
\ No newline at end of file
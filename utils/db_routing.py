@@ -0,0 +1,63 @@
+import time
+import random
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from config import Config
+
+# 写请求之后在此 Cookie 记录的时间之前，该客户端的读请求仍走主库（读己之写）
+PIN_COOKIE = 'db_primary_until'
+# 同样的时间也放在响应头中：跨域部署的前端拿不到 Cookie，需在之后的请求中原样带上该请求头
+PIN_HEADER = 'X-DB-Primary-Until'
+
+READ_METHODS = ('GET', 'HEAD')
+
+def replica_binds():
+    """只读副本的 bind 名称：replica_0、replica_1 ..."""
+    return [key for key in Config.SQLALCHEMY_BINDS if key.startswith('replica_')]
+
+
+class RoutingSession(Session):
+    """读请求中的查询路由到只读副本的会话
+
+    只有请求开始时选定了副本（g.db_replica）且语句是普通 SELECT 时才走副本；
+    flush、UPDATE/DELETE、SELECT ... FOR UPDATE 以及后台线程中的查询始终走主库。
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _is_plain_select(clause):
+            replica = g.get('db_replica') if has_app_context() else None
+            if replica:
+                return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_plain_select(clause):
+    return (clause is not None and getattr(clause, 'is_select', False)
+            and getattr(clause, '_for_update_arg', None) is None)
+
+
+def route_request(request):
+    """为读请求选择一个只读副本（最近写过数据的客户端除外）"""
+    g.db_replica = None
+    binds = replica_binds()
+    if not binds or request.method not in READ_METHODS:
+        return
+    for pin in (request.headers.get(PIN_HEADER), request.cookies.get(PIN_COOKIE)):
+        try:
+            if pin and float(pin) > time.time():
+                return
+        except ValueError:
+            pass
+    g.db_replica = random.choice(binds)
+
+
+def pin_after_write(request, response):
+    """写请求成功后设置 Cookie 和 PIN_HEADER 响应头，在 DB_REPLICA_PIN_SECONDS 秒内让该客户端的读请求走主库"""
+    if not replica_binds() or request.method in READ_METHODS + ('OPTIONS',):
+        return response
+    if response.status_code < 400:
+        pin = Config.DB_REPLICA_PIN_SECONDS
+        until = str(int(time.time() + pin))
+        response.set_cookie(PIN_COOKIE, until, max_age=pin, httponly=True, samesite='Lax')
+        response.headers[PIN_HEADER] = until
+    return response
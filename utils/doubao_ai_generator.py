@@ -1,38 +1,60 @@
 import os
+import re
+import json
+import time
+import base64
 import logging
 from volcenginesdkarkruntime import Ark
 from config import Config
+from utils.keyword_cache import KeywordCache
+from utils.video_keyframes import sample_keyframes
+from utils.ark_client import ResilientArkClient, CallRejectedError
+from utils.metrics import metrics
+
+# 提示词版本号，修改提示词后需同步递增，使旧的缓存结果失效
+PROMPT_VERSION = 'v1'
 
 class DoubaoAIGenerator:
-    def __init__(self):
+    def __init__(self, model=None):
+        # 默认模型；各生成方法可通过 model 参数按次指定其他模型（如按新模型批量重新分析），
+        # 所有模型共用同一个客户端和 ArkGovernor 的限流、并发上限与熔断
         self.api_key = Config.ARK_API_KEY
-        self.model = Config.DOUBAO_MODEL
+        self.model = model or Config.DOUBAO_MODEL
         self.base_url = Config.DOUBAO_BASE_URL
+        self.cache = KeywordCache() if Config.KEYWORD_CACHE_ENABLED else None
         
-        if self.api_key and self.model:
-            try:
-                self.client = Ark(
-                    base_url=self.base_url,
-                    api_key=self.api_key
-                )
-                logging.info("✅ 豆包AI客户端初始化成功")
-            except Exception as e:
-                logging.error(f"❌ 豆包AI客户端初始化失败: {e}")
-                self.client = None
-        else:
-            logging.warning("豆包API配置不完整")
-            self.client = None
+        # 配置不完整或客户端创建失败时直接抛出，由 LazyService 按 SERVICE_RETRY_INTERVAL 重试
+        if not (self.api_key and self.model):
+            raise ValueError("豆包API配置不完整")
+        # 重试和超时由 ResilientArkClient 统一控制，关闭 SDK 自带的重试
+        self.client = ResilientArkClient(Ark(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            timeout=Config.ARK_TIMEOUT,
+            max_retries=0
+        ))
+        logging.info("✅ 豆包AI客户端初始化成功")
+
+    def generate_keywords_from_image_url(self, image_url, content_hash=None, bypass_cache=False, model=None):
+        """根据图片URL生成通用农作物关键词
 
-    def generate_keywords_from_image_url(self, image_url):
-        """根据图片URL生成通用农作物关键词"""
+        content_hash 用作缓存键（缺省时使用URL），bypass_cache=True 时强制重新分析，
+        model 缺省时使用默认模型
+        """
         if not self.client:
-            return self._get_fallback_keywords()
+            return self._get_fallback_keywords(attempted=False)
+
+        model = model or self.model
+        cache_key = self._cache_key('image', content_hash or image_url, model)
+        cached = self._cache_lookup(cache_key, bypass_cache)
+        if cached:
+            return cached
 
         try:
             logging.info(f"🖼️ 开始分析农作物图片: {image_url}")
             
             response = self.client.chat.completions.create(
-                model=self.model,
+                model=model,
                 messages=[
                     {
                         "role": "user",
@@ -59,13 +81,15 @@ class DoubaoAIGenerator:
                         ]
                     }
                 ],
-                extra_headers={'x-is-encrypted': 'true'},
+                extra_headers=self._extra_headers(),
             )
             
             if response.choices and len(response.choices) > 0:
                 content = response.choices[0].message.content
                 logging.info(f"🤖 AI回复内容: {content}")
                 cleaned_keywords = self._clean_keywords(content)
+                self._cache_store(cache_key, cleaned_keywords, model)
+                metrics.inc('suyuan_ai_results_total', result='success')
                 return {
                     'success': True,
                     'ai_keywords': cleaned_keywords
@@ -74,22 +98,58 @@ class DoubaoAIGenerator:
                 logging.warning("AI返回空结果")
                 return self._get_fallback_keywords()
                 
+        except CallRejectedError as e:
+            logging.warning(f"农作物图片未分析: {e}")
+            return self._get_fallback_keywords(attempted=False)
         except Exception as e:
             logging.error(f"农作物图片分析失败: {e}")
             return self._get_fallback_keywords()
 
-    def generate_keywords_from_video(self, video_url):
-        """为农业视频生成通用关键词"""
+    def generate_keywords_from_video(self, video_url, content_hash=None, bypass_cache=False, model=None):
+        """为农业视频生成关键词
+
+        先从视频中均匀抽取若干关键帧，与提示词一起在一次请求中发送给大模型；
+        抽帧失败（如未安装 ffmpeg）时退回到只发送文字提示词。
+        """
         if not self.client:
-            return self._get_fallback_keywords(video=True)
+            return self._get_fallback_keywords(video=True, attempted=False)
+
+        model = model or self.model
+        # 抽帧分析的结果与早期纯文字提示词的结果区分开缓存
+        cache_key = self._cache_key('video-frames', content_hash or video_url, model)
+        cached = self._cache_lookup(cache_key, bypass_cache)
+        if cached:
+            return cached
             
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
+            with metrics.timer('suyuan_stage_seconds', stage='video_keyframes'):
+                frames = sample_keyframes(video_url)
+            
+            if frames:
+                content = [
                     {
-                        "role": "user",
-                        "content": f"""请为农业视频生成适合溯源故事的关键词。
+                        "type": "image_url",
+                        "image_url": {
+                            "url": "data:image/jpeg;base64," + base64.b64encode(frame).decode('ascii')
+                        }
+                    }
+                    for frame in frames
+                ]
+                content.append({
+                    "type": "text",
+                    "text": f"""以上是从同一段农业视频中按时间顺序截取的 {len(frames)} 帧画面，请综合分析整段视频，生成适合溯源故事的关键词。
+
+请重点关注：
+1. 识别视频中的农作物种类和特征
+2. 视频中的农业操作和活动
+3. 生长过程和阶段
+4. 环境场景特征
+5. 品质管理要点
+
+请生成15-20个描述性关键词，用中文逗号分隔，直接返回关键词字符串。"""
+                })
+            else:
+                content = f"""请为农业视频生成适合溯源故事的关键词。
 
 视频可能包含各种农作物的种植、生长、管理、采摘等农业活动。
 
@@ -101,14 +161,25 @@ class DoubaoAIGenerator:
 - 品质管理要点
 
 用中文逗号分隔，直接返回关键词字符串。"""
+            
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": content
                     }
                 ],
-                extra_headers={'x-is-encrypted': 'true'},
+                extra_headers=self._extra_headers(),
             )
             
             if response.choices and len(response.choices) > 0:
                 content = response.choices[0].message.content
                 cleaned_keywords = self._clean_keywords(content)
+                # 只缓存真正看过视频画面的结果
+                if frames:
+                    self._cache_store(cache_key, cleaned_keywords, model)
+                metrics.inc('suyuan_ai_results_total', result='success')
                 return {
                     'success': True,
                     'ai_keywords': cleaned_keywords
@@ -116,10 +187,165 @@ class DoubaoAIGenerator:
             else:
                 return self._get_fallback_keywords(video=True)
                 
+        except CallRejectedError as e:
+            logging.warning(f"农业视频未分析: {e}")
+            return self._get_fallback_keywords(video=True, attempted=False)
         except Exception as e:
             logging.error(f"农业视频关键词生成失败: {e}")
             return self._get_fallback_keywords(video=True)
 
+    def generate_keywords_batch(self, images, batch_size=None, model=None):
+        """批量分析多张图片，返回与输入顺序一致的结果列表
+
+        images 为 [(image_url, content_hash), ...]。未命中缓存的图片每 batch_size 张
+        打包成一次请求，要求大模型按序号返回 JSON 数组；某一批解析失败或缺少
+        某张图片的结果时，对这些图片逐张重新调用。请求本身失败（超时、网络错误、熔断）时
+        整批直接使用备用关键词，等待补跑，不再逐张重试放大豆包的负载；
+        请求被熔断或排队超时拦下、没有发给豆包时，备用结果标记 attempted=False。
+        """
+        batch_size = batch_size or Config.AI_BATCH_SIZE
+        model = model or self.model
+        results = [None] * len(images)
+        
+        if not self.client:
+            return [self._get_fallback_keywords(attempted=False) for _ in images]
+        
+        misses = []
+        for index, (image_url, content_hash) in enumerate(images):
+            cache_key = self._cache_key('image', content_hash or image_url, model)
+            cached = self._cache_lookup(cache_key, False)
+            if cached:
+                results[index] = cached
+            else:
+                misses.append((index, image_url, content_hash, cache_key))
+        
+        for start in range(0, len(misses), batch_size):
+            batch = misses[start:start + batch_size]
+            if len(batch) == 1:
+                index, image_url, content_hash, _ = batch[0]
+                results[index] = self.generate_keywords_from_image_url(image_url, content_hash, bypass_cache=True, model=model)
+                continue
+            
+            try:
+                keywords_by_index = self._analyze_image_batch([image_url for _, image_url, _, _ in batch], model)
+            except CallRejectedError as e:
+                logging.warning(f"批量图片未分析: {e}")
+                for index, _, _, _ in batch:
+                    results[index] = self._get_fallback_keywords(attempted=False)
+                continue
+            if keywords_by_index is None:
+                for index, _, _, _ in batch:
+                    results[index] = self._get_fallback_keywords()
+                continue
+            
+            for position, (index, image_url, content_hash, cache_key) in enumerate(batch):
+                keywords = keywords_by_index.get(position + 1)
+                if keywords:
+                    self._cache_store(cache_key, keywords, model)
+                    metrics.inc('suyuan_ai_results_total', result='success')
+                    results[index] = {
+                        'success': True,
+                        'ai_keywords': keywords
+                    }
+                else:
+                    logging.warning(f"批量分析缺少第 {position + 1} 张图片的结果，改为单张分析")
+                    results[index] = self.generate_keywords_from_image_url(image_url, content_hash, bypass_cache=True, model=model)
+        
+        return results
+
+    def _analyze_image_batch(self, image_urls, model):
+        """一次请求分析多张图片，返回 {序号(从1开始): 关键词}
+
+        返回内容无法解析时为空字典（调用方逐张重试），请求失败时为 None，
+        请求被本地保护拦下时抛出 CallRejectedError。
+        """
+        content = []
+        for number, image_url in enumerate(image_urls, start=1):
+            content.append({"type": "text", "text": f"图片{number}："})
+            content.append({"type": "image_url", "image_url": {"url": image_url}})
+        content.append({
+            "type": "text",
+            "text": f"""以上是 {len(image_urls)} 张独立的农业图片，请分别分析每一张，生成适合用于农产品溯源故事文案的关键词。
+
+每张图片请重点关注：农作物种类、生长状况和形状颜色特征、生长场景和环境、健康状况和品质特点、相关的农业活动。
+每张图片生成15-20个准确描述图片内容的关键词，用中文逗号分隔。
+
+请只返回一个 JSON 数组，不要返回其他文字，格式如下：
+[{{"index": 1, "keywords": "关键词1，关键词2，..."}}, {{"index": 2, "keywords": "..."}}]"""
+        })
+        
+        started = time.time()
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": content
+                    }
+                ],
+                extra_headers=self._extra_headers(),
+            )
+            elapsed = time.time() - started
+            logging.info(f"🖼️ 批量分析 {len(image_urls)} 张图片耗时 {elapsed:.2f}s")
+            
+            if not response.choices:
+                return {}
+            return self._parse_batch_keywords(response.choices[0].message.content)
+            
+        except CallRejectedError:
+            raise
+        except Exception as e:
+            logging.error(f"批量图片分析失败（{time.time() - started:.2f}s）: {e}")
+            return None
+
+    def _parse_batch_keywords(self, content):
+        """解析批量分析返回的 JSON 数组，格式不对时返回空字典"""
+        match = re.search(r'\[.*\]', content or '', re.S)
+        if not match:
+            logging.warning(f"批量分析返回格式无法解析: {content}")
+            return {}
+        
+        try:
+            items = json.loads(match.group(0))
+            keywords_by_index = {}
+            for item in items:
+                keywords = self._clean_keywords(str(item.get('keywords', '')))
+                if keywords:
+                    keywords_by_index[int(item['index'])] = keywords
+            return keywords_by_index
+        except Exception as e:
+            logging.warning(f"批量分析返回格式无法解析: {e}")
+            return {}
+
+    def _extra_headers(self):
+        # SDK 会往请求头字典里写入加密会话信息，每次调用都返回新字典
+        return {'x-is-encrypted': 'true'} if Config.DOUBAO_E2E_ENCRYPTION else {}
+
+    def _cache_key(self, kind, source, model):
+        if not self.cache:
+            return None
+        return KeywordCache.make_key(f"{kind}:{source}", model, PROMPT_VERSION)
+
+    def _cache_lookup(self, cache_key, bypass_cache):
+        """命中缓存时返回与大模型调用相同结构的结果"""
+        if not cache_key or bypass_cache:
+            return None
+        ai_keywords = self.cache.get(cache_key)
+        if ai_keywords is None:
+            return None
+        metrics.inc('suyuan_ai_results_total', result='cached')
+        return {
+            'success': True,
+            'ai_keywords': ai_keywords,
+            'cached': True
+        }
+
+    def _cache_store(self, cache_key, ai_keywords, model):
+        # 只缓存成功的结果，备用关键词不入缓存
+        if cache_key and ai_keywords:
+            self.cache.set(cache_key, ai_keywords, model=model)
+
     def _clean_keywords(self, keywords_text):
         """清理关键词"""
         # 移除可能的解释文字
@@ -135,8 +361,12 @@ class DoubaoAIGenerator:
         # 不再强制添加"鹰嘴蜜桃"，让AI自由识别
         return '，'.join(keywords[:20])
 
-    def _get_fallback_keywords(self, video=False):
-        """备用关键词（通用农业关键词）"""
+    def _get_fallback_keywords(self, video=False, attempted=True):
+        """备用关键词（通用农业关键词）
+
+        attempted=False 表示没有调用大模型（客户端不可用、熔断、排队超时），不计入分析尝试次数
+        """
+        metrics.inc('suyuan_ai_results_total', result='fallback')
         if video:
             keywords = [
                 '农业视频', '生长记录', '农田管理', '种植过程',
@@ -152,5 +382,6 @@ class DoubaoAIGenerator:
         
         return {
             'success': False,
-            'ai_keywords': '，'.join(keywords)
+            'ai_keywords': '，'.join(keywords),
+            'attempted': attempted
         }
\ No newline at end of file
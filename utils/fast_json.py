@@ -0,0 +1,37 @@
+import json
+from flask.json.provider import DefaultJSONProvider
+from utils.metrics import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(obj):
+    """序列化为 JSON 字符串：安装了 orjson 时使用 orjson，否则使用标准库"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify 使用 orjson 序列化（未安装或遇到不支持的类型时退回默认实现），并统计序列化耗时"""
+
+    def response(self, *args, **kwargs):
+        with metrics.timer('suyuan_stage_seconds', stage='serialize'):
+            # 调试模式保留默认实现的缩进输出
+            if orjson is None or self._app.debug:
+                return super().response(*args, **kwargs)
+
+            obj = self._prepare_response_obj(args, kwargs)
+            try:
+                # datetime 交给 default 处理，与默认实现的输出格式保持一致
+                body = orjson.dumps(obj, default=self.default, option=(
+                    orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                ))
+            except TypeError:
+                return super().response(*args, **kwargs)
+            return self._app.response_class(body + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,82 @@
+import io
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from config import Config
+from utils.metrics import metrics
+
+# 衍生图规格：名称 -> (最长边像素, 格式, 扩展名, 质量)
+DERIVATIVE_SPECS = {
+    'analysis': (1024, 'JPEG', '.jpg', 85),   # 发送给大模型分析
+    'thumbnail': (320, 'JPEG', '.jpg', 80),   # 列表缩略图
+    'web': (1600, 'WEBP', '.webp', 80),       # 网页展示
+}
+
+def render_derivatives(data):
+    """生成各规格的衍生图，返回 {名称: (扩展名, 图片字节)}（在子进程中执行）"""
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as source:
+        # 按 EXIF 方向摆正手机照片
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        results = {}
+        for name, (max_side, image_format, extension, quality) in DERIVATIVE_SPECS.items():
+            rendition = image.copy()
+            rendition.thumbnail((max_side, max_side), Image.LANCZOS)
+            buffer = io.BytesIO()
+            rendition.save(buffer, format=image_format, quality=quality)
+            results[name] = (extension, buffer.getvalue())
+        return results
+
+class DerivativeGenerator:
+    """在进程池中生成衍生图，避免缩放编码这类CPU密集操作占用请求线程的 GIL"""
+
+    def __init__(self, workers=None, timeout=None):
+        self.workers = workers or Config.DERIVATIVE_WORKERS
+        self.timeout = timeout or Config.DERIVATIVE_TIMEOUT
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def generate(self, data):
+        """生成衍生图，失败时记录告警和 suyuan_derivative_failures_total 并返回空字典"""
+        executor = self._get_executor()
+        try:
+            return executor.submit(render_derivatives, data).result(timeout=self.timeout)
+        except BrokenProcessPool as e:
+            # 子进程异常退出（如处理超大图片时被 OOM kill）后整个进程池不再可用，换一个新的
+            self._discard(executor)
+            reason, error = 'broken_pool', e
+        except FutureTimeoutError as e:
+            # 超时不会终止子进程，任务仍占着进程池，换一个新的；旧进程池处理完手头的任务后退出
+            self._discard(executor)
+            reason, error = 'timeout', e
+        except Exception as e:
+            reason, error = 'error', e
+        logging.warning(f"衍生图生成失败（{reason}）: {error!r}")
+        metrics.inc('suyuan_derivative_failures_total', reason=reason)
+        return {}
+
+    def _get_executor(self):
+        # 进程池在首次使用时按进程创建，gunicorn fork 出的 worker 各自持有一个。
+        # worker 是多线程的，子进程用 spawn 启动，不继承 fork 时其他线程持有的锁
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _discard(self, executor):
+        """丢弃出问题的进程池，下次调用时重新创建"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
@@ -0,0 +1,169 @@
+import io
+import time
+import hashlib
+from utils.metrics import metrics
+
+# 嗅探文件类型需要的头部字节数
+SNIFF_BYTES = 64
+# drain() 每次读取的缓冲区大小
+CHUNK_SIZE = 1024 * 1024
+
+# ISO 媒体文件（ftyp 盒子）的品牌 -> MIME 类型
+_FTYP_BRANDS = {
+    b'heic': 'image/heic', b'heix': 'image/heic', b'mif1': 'image/heic', b'msf1': 'image/heic',
+    b'avif': 'image/avif',
+    b'qt  ': 'video/quicktime',
+    b'isom': 'video/mp4', b'iso2': 'video/mp4', b'mp41': 'video/mp4', b'mp42': 'video/mp4',
+    b'avc1': 'video/mp4', b'dash': 'video/mp4', b'M4V ': 'video/mp4',
+    b'3gp4': 'video/3gpp', b'3gp5': 'video/3gpp', b'3g2a': 'video/3gpp',
+}
+
+# BMP 的 DIB 信息头长度（偏移 14 处，小端），用来区分真正的位图和以 "BM" 开头的文本
+_BMP_DIB_HEADER_SIZES = (12, 40, 52, 56, 108, 124)
+
+# 支持的 MIME 类型 -> (素材类型, 对象键扩展名)
+SUPPORTED_TYPES = {
+    'image/jpeg': ('image', '.jpg'),
+    'image/png': ('image', '.png'),
+    'image/gif': ('image', '.gif'),
+    'image/webp': ('image', '.webp'),
+    'image/bmp': ('image', '.bmp'),
+    'image/tiff': ('image', '.tif'),
+    'image/heic': ('image', '.heic'),
+    'image/avif': ('image', '.avif'),
+    'video/mp4': ('video', '.mp4'),
+    'video/quicktime': ('video', '.mov'),
+    'video/x-msvideo': ('video', '.avi'),
+    'video/3gpp': ('video', '.3gp'),
+}
+
+def sniff_mime_type(head):
+    """按文件头的魔数判断 MIME 类型，不认识的格式返回 None（不依赖文件扩展名）"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head.startswith(b'RIFF') and head[8:12] == b'AVI ':
+        return 'video/x-msvideo'
+    if head.startswith(b'BM') and len(head) >= 18 \
+            and int.from_bytes(head[14:18], 'little') in _BMP_DIB_HEADER_SIZES:
+        return 'image/bmp'
+    if head.startswith((b'II*\x00', b'MM\x00*')):
+        return 'image/tiff'
+    if head[4:8] == b'ftyp':
+        # 主品牌不认识时再看兼容品牌（如 mif1 + heic）
+        box_size = int.from_bytes(head[:4], 'big')
+        for offset in [8] + list(range(16, min(box_size, len(head)) - 3, 4)):
+            mime_type = _FTYP_BRANDS.get(head[offset:offset + 4])
+            if mime_type:
+                return mime_type
+    # 没有 ftyp 盒子的老式 QuickTime 文件
+    if head[4:8] in (b'moov', b'mdat', b'wide', b'free', b'skip'):
+        return 'video/quicktime'
+    return None
+
+
+class IngestStream:
+    """上传用的单遍读取流：数据被上传方读取的同时计算 SHA-256、累计大小并限制总大小
+
+    创建时先读取文件头按魔数识别真实类型（mime_type / file_type / extension，
+    不支持的格式为 None），调用方可以在上传开始前拒绝文件。之后数据按读取方请求的
+    块大小原样透传，不额外复制，也不会把整个文件缓存在内存中。
+    底层流可 seek 时支持 seek(0) 从头重新读取（COS SDK 重试上传时使用）。
+    capture=True 时同时保留读到的数据（只用于有大小上限的图片，供上传和生成衍生图复用）。
+    """
+
+    def __init__(self, stream, max_size=None, capture=False):
+        self.stream = stream
+        self.max_size = max_size
+        self.capture = capture
+        # 底层流可 seek 时（如已落盘的表单文件）通过 seek 直接得到总大小，不读取数据
+        self.length = self._stream_length(stream)
+        if self.length is not None:
+            # requests 据此设置 Content-Length（没有该属性时分块传输）
+            self.len = self.length
+        self.hash_seconds = 0.0
+        self._reset()
+
+    def _reset(self):
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self._finished = False
+        self._chunks = []
+
+        head = b''
+        while len(head) < SNIFF_BYTES:
+            data = self.stream.read(SNIFF_BYTES - len(head))
+            if not data:
+                break
+            head += data
+        self._head = head
+        self.mime_type = sniff_mime_type(head)
+        self.file_type, self.extension = SUPPORTED_TYPES.get(self.mime_type, (None, None))
+
+    @staticmethod
+    def _stream_length(stream):
+        try:
+            position = stream.tell()
+            length = stream.seek(0, io.SEEK_END)
+            stream.seek(position)
+            return length - position
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    def read(self, size=-1):
+        if self._head:
+            if size is None or size < 0:
+                data, self._head = self._head + self.stream.read(), b''
+            elif size >= len(self._head):
+                data, self._head = self._head, b''
+            else:
+                data, self._head = self._head[:size], self._head[size:]
+        else:
+            data = self.stream.read(size)
+
+        if data:
+            self.size += len(data)
+            if self.max_size is not None and self.size > self.max_size:
+                raise ValueError(f"文件超过大小上限 {self.max_size} 字节")
+            started = time.perf_counter()
+            self.digest.update(data)
+            self.hash_seconds += time.perf_counter() - started
+            if self.capture:
+                self._chunks.append(data)
+        elif not self._finished:
+            self._finished = True
+            metrics.observe('suyuan_stage_seconds', self.hash_seconds, stage='hash')
+        return data
+
+    def drain(self):
+        """按固定大小的缓冲区读到结尾（只计算摘要和大小），返回总字节数"""
+        while self.read(CHUNK_SIZE):
+            pass
+        return self.size
+
+    def captured(self):
+        """capture=True 时已读取的全部数据"""
+        if len(self._chunks) > 1:
+            self._chunks = [b''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else b''
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+    def tell(self):
+        return self.size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """只支持回到开头重新读取（摘要和大小随之重新计算）"""
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation('IngestStream 只支持 seek(0)')
+        if self.size:
+            self.stream.seek(0)
+            self.hash_seconds = 0.0
+            self._reset()
+        return 0
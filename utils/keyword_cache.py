@@ -0,0 +1,126 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from models import db, KeywordCacheEntry
+from config import Config
+from utils.metrics import metrics
+
+class KeywordCache:
+    """AI关键词结果缓存：进程内 LRU + 数据库持久层
+
+    键由内容哈希（或文件URL）、模型名和提示词版本组成，模型或提示词变化后
+    旧结果自然失效。两层都按 TTL 过期，LRU 按条数淘汰，数据库层超过上限时
+    删除最旧的记录。
+    """
+
+    def __init__(self, max_entries=None, ttl=None, db_max_entries=None):
+        self.max_entries = max_entries or Config.KEYWORD_CACHE_SIZE
+        self.ttl = timedelta(seconds=ttl or Config.KEYWORD_CACHE_TTL)
+        self.db_max_entries = db_max_entries or Config.KEYWORD_CACHE_DB_MAX_ENTRIES
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (ai_keywords, created_at)
+        self._writes = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(source, model, prompt_version):
+        raw = f"{model}|{prompt_version}|{source}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """查询缓存，未命中返回 None"""
+        now = datetime.utcnow()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                metrics.inc('suyuan_cache_requests_total', cache='keyword', result='memory_hit')
+                return entry[0]
+            if entry:
+                del self._entries[key]
+
+        try:
+            with Session(db.engine) as session:
+                row = session.get(KeywordCacheEntry, key)
+                if row and now - row.created_at < self.ttl:
+                    self._remember(key, row.ai_keywords, row.created_at)
+                    with self._lock:
+                        self.db_hits += 1
+                    metrics.inc('suyuan_cache_requests_total', cache='keyword', result='db_hit')
+                    return row.ai_keywords
+        except Exception as e:
+            logging.warning(f"关键词缓存读取失败: {e}")
+
+        with self._lock:
+            self.misses += 1
+        metrics.inc('suyuan_cache_requests_total', cache='keyword', result='miss')
+        return None
+
+    def set(self, key, ai_keywords, model=None):
+        """写入两层缓存（数据库层使用独立会话，不影响调用方事务）"""
+        now = datetime.utcnow()
+        self._remember(key, ai_keywords, now)
+
+        try:
+            with Session(db.engine) as session:
+                session.merge(KeywordCacheEntry(
+                    cache_key=key,
+                    ai_keywords=ai_keywords,
+                    model=model,
+                    created_at=now
+                ))
+                session.commit()
+        except Exception as e:
+            logging.warning(f"关键词缓存写入失败: {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            should_prune = self._writes % 100 == 0
+        if should_prune:
+            self.prune()
+
+    def prune(self):
+        """清理数据库层中过期和超出数量上限的记录"""
+        try:
+            with Session(db.engine) as session:
+                expired_before = datetime.utcnow() - self.ttl
+                session.query(KeywordCacheEntry)\
+                    .filter(KeywordCacheEntry.created_at < expired_before)\
+                    .delete(synchronize_session=False)
+
+                total = session.query(KeywordCacheEntry).count()
+                if total > self.db_max_entries:
+                    cutoff = session.query(KeywordCacheEntry.created_at)\
+                        .order_by(KeywordCacheEntry.created_at.desc())\
+                        .offset(self.db_max_entries).limit(1).scalar()
+                    session.query(KeywordCacheEntry)\
+                        .filter(KeywordCacheEntry.created_at <= cutoff)\
+                        .delete(synchronize_session=False)
+                session.commit()
+        except Exception as e:
+            logging.warning(f"关键词缓存清理失败: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memory_entries': len(self._entries),
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses
+            }
+
+    def _remember(self, key, ai_keywords, created_at):
+        with self._lock:
+            self._entries[key] = (ai_keywords, created_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,104 @@
+import time
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_
+from models import db, Material, KeywordJob, DataVersion
+from config import Config
+from utils.background_worker import BackgroundWorker, claim_first
+
+class KeywordJobQueue(BackgroundWorker):
+    """基于数据库表的关键词生成任务队列
+
+    上传接口只负责写入 KeywordJob 记录，后台工作线程轮询领取任务并调用
+    handler(material) 补全关键词。任务表即队列，Web进程和独立 worker.py
+    可以同时消费，靠条件更新保证同一任务只被一个线程领取。
+    """
+
+    thread_name = 'keyword-worker'
+    description = '关键词生成工作'
+
+    def __init__(self, app, handler, workers=None, poll_interval=None):
+        super().__init__(app, workers or Config.AI_WORKER_THREADS,
+                         poll_interval or Config.AI_JOB_POLL_INTERVAL)
+        self.handler = handler
+        self.max_attempts = Config.AI_JOB_MAX_ATTEMPTS
+        self.job_timeout = Config.AI_JOB_TIMEOUT
+
+    def enqueue(self, material_id):
+        """创建任务记录（随调用方的事务一起提交）"""
+        job = KeywordJob(material_id=material_id)
+        db.session.add(job)
+        return job
+
+    def run_forever(self):
+        """独立 worker 进程入口：启动工作线程并阻塞直到收到中断"""
+        self.ensure_started()
+        try:
+            while not self._stop.is_set():
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def run_once(self):
+        """领取并处理一个任务，没有可领取的任务时返回 False"""
+        with self.app.app_context():
+            job_id = self._claim_next()
+            if not job_id:
+                return False
+            self._process(job_id)
+            return True
+
+    def _claim_next(self):
+        """领取最早的待处理任务（包括超时未完成的运行中任务）"""
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=self.job_timeout)
+        claimable = or_(
+            KeywordJob.status == 'pending',
+            and_(KeywordJob.status == 'running', KeywordJob.updated_at < stale_before)
+        )
+
+        candidates = KeywordJob.query.with_entities(KeywordJob.id)\
+            .filter(claimable)\
+            .order_by(KeywordJob.created_at)\
+            .limit(self.workers)\
+            .all()
+
+        return claim_first(KeywordJob, candidates, claimable, {
+            'status': 'running',
+            'attempts': KeywordJob.attempts + 1,
+            'updated_at': now
+        })
+
+    def _process(self, job_id):
+        job = db.session.get(KeywordJob, job_id)
+        material = db.session.get(Material, job.material_id)
+
+        if not material:
+            job.status = 'failed'
+            job.error = '素材不存在'
+            job.updated_at = datetime.utcnow()
+            db.session.commit()
+            return
+
+        try:
+            # handler 负责记录关键词和状态（返回备用关键词时素材为 failed，由补跑任务处理）
+            self.handler(material)
+            material.sync_keyword_index()
+            job.status = 'done'
+            job.error = None
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(KeywordJob, job_id)
+            logging.error(f"关键词任务 {job_id} 失败（第 {job.attempts} 次）: {e}")
+            job.error = str(e)
+            if job.attempts >= self.max_attempts:
+                job.status = 'failed'
+                material = db.session.get(Material, job.material_id)
+                if material:
+                    material.ai_status = 'failed'
+            else:
+                job.status = 'pending'
+
+        job.updated_at = datetime.utcnow()
+        DataVersion.bump()
+        db.session.commit()
@@ -0,0 +1,188 @@
+import time
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_
+from models import db, Material, SweepRun, DataVersion
+from config import Config
+from utils.background_worker import BackgroundWorker, claim_first
+
+# failed：备用关键词；stale：备用关键词或不是目标模型生成的；all：全部素材
+SWEEP_MODES = ('failed', 'stale', 'all')
+# data_versions 中记录上次定时创建补跑任务时间的行
+AUTO_SWEEP_SCHEDULE = 'sweep_auto'
+
+class KeywordSweeper(BackgroundWorker):
+    """关键词补跑：分批重新分析备用关键词、旧模型生成的素材，或用指定模型重新分析全部素材
+
+    每个补跑任务（SweepRun）按 (upload_time, id) 倒序处理，优先覆盖最近上传的素材，
+    每批处理完把游标写回数据库，进程重启后从断点继续。批次之间间隔 SWEEP_INTERVAL 秒，
+    豆包调用本身还受 ResilientArkClient 限流。handler(materials, model) 负责生成关键词，
+    返回没有调用大模型的素材（熔断、客户端不可用）；有这样的素材时整批保持原样，稍后重试，
+    不消耗素材的尝试次数。
+    """
+
+    thread_name = 'keyword-sweeper'
+    description = '关键词补跑'
+
+    def __init__(self, app, handler, batch_size=None, interval=None):
+        self.interval = interval if interval is not None else Config.SWEEP_INTERVAL
+        super().__init__(app, 1, Config.SWEEP_POLL_INTERVAL, busy_interval=self.interval)
+        self.handler = handler
+        self.batch_size = batch_size or Config.SWEEP_BATCH_SIZE
+        self.max_attempts = Config.SWEEP_MAX_ATTEMPTS
+        self.auto_interval = Config.SWEEP_AUTO_INTERVAL
+        self.lease_timeout = Config.AI_JOB_TIMEOUT
+
+    def start_run(self, mode, model=None, auto=False):
+        """创建补跑任务；相同范围和模型的任务尚未完成时继续该任务"""
+        if mode not in SWEEP_MODES:
+            raise ValueError(f"mode 只能是 {' / '.join(SWEEP_MODES)}")
+        model = model or Config.DOUBAO_MODEL
+
+        run = SweepRun.query.filter(
+            SweepRun.mode == mode,
+            SweepRun.model == model,
+            SweepRun.status.in_(('running', 'paused'))
+        ).order_by(SweepRun.created_at.desc()).first()
+        if run:
+            run.status = 'running'
+            run.updated_at = datetime.utcnow()
+        else:
+            run = SweepRun(mode=mode, model=model, auto=auto)
+            db.session.add(run)
+        db.session.commit()
+        self._wakeup.set()
+        return run
+
+    def set_status(self, run_id, status):
+        """暂停（paused）或继续（running）补跑任务，任务不存在或已完成时返回 None"""
+        run = db.session.get(SweepRun, run_id)
+        if not run or run.status == 'done':
+            return None
+        run.status = status
+        run.updated_at = datetime.utcnow()
+        db.session.commit()
+        if status == 'running':
+            self._wakeup.set()
+        return run
+
+    def run_once(self, run_id=None):
+        """领取一个补跑任务并处理一批素材，没有可领取的任务或豆包暂不可用时返回 False
+
+        后台线程每次领取前先检查是否需要定时创建补跑任务
+        """
+        with self.app.app_context():
+            if run_id is None:
+                self._schedule_auto()
+            run = self._claim(run_id)
+            if not run:
+                return False
+            return self._process(run)
+
+    def run_until_done(self, run_id, progress=None):
+        """在当前进程中把指定任务处理完（命令行使用），任务被暂停时提前返回"""
+        while True:
+            if self.run_once(run_id):
+                with self.app.app_context():
+                    run = db.session.get(SweepRun, run_id)
+                    if progress:
+                        progress(run)
+                    if run.status == 'done':
+                        return run
+                time.sleep(self.interval)
+                continue
+
+            with self.app.app_context():
+                run = db.session.get(SweepRun, run_id)
+                if run.status != 'running':
+                    return run
+            # 其他进程正持有该任务的租约，或豆包暂不可用
+            time.sleep(self.poll_interval)
+
+    def _schedule_auto(self):
+        """定时为备用关键词创建补跑任务（已有未完成的任务时不创建）
+
+        每个 Web worker 都有补跑线程，先通过条件更新领取本次定时调度，只有领取成功的线程创建任务
+        """
+        if not self.auto_interval:
+            return
+        if SweepRun.query.filter(SweepRun.status.in_(('running', 'paused'))).first():
+            return
+        if not DataVersion.claim_interval(AUTO_SWEEP_SCHEDULE, timedelta(seconds=self.auto_interval)):
+            return
+        self.start_run('failed', auto=True)
+
+    def _claim(self, run_id=None):
+        """领取运行中且没有有效租约的任务（条件更新保证只被一个线程领取）"""
+        now = datetime.utcnow()
+        claimable = and_(
+            SweepRun.status == 'running',
+            or_(SweepRun.lease_until.is_(None), SweepRun.lease_until < now)
+        )
+
+        query = SweepRun.query.with_entities(SweepRun.id).filter(claimable)
+        if run_id:
+            query = query.filter(SweepRun.id == run_id)
+        candidates = query.order_by(SweepRun.created_at).limit(5).all()
+
+        claimed_id = claim_first(SweepRun, candidates, claimable,
+                                 {'lease_until': now + timedelta(seconds=self.lease_timeout)})
+        return db.session.get(SweepRun, claimed_id) if claimed_id else None
+
+    def _candidates(self, run):
+        query = Material.query.filter(Material.ai_status != 'pending')
+        retryable = and_(Material.ai_status == 'failed', Material.ai_attempts < self.max_attempts)
+        if run.mode == 'failed':
+            query = query.filter(retryable)
+        elif run.mode == 'stale':
+            query = query.filter(or_(retryable, Material.ai_model.is_(None), Material.ai_model != run.model))
+
+        if run.cursor_time:
+            query = query.filter(or_(
+                Material.upload_time < run.cursor_time,
+                and_(Material.upload_time == run.cursor_time, Material.id < run.cursor_id)
+            ))
+        return query.order_by(Material.upload_time.desc(), Material.id.desc())\
+            .limit(self.batch_size).all()
+
+    def _process(self, run):
+        run_id = run.id
+        materials = self._candidates(run)
+
+        if not materials:
+            run.status = 'done'
+            run.lease_until = None
+            run.updated_at = datetime.utcnow()
+            db.session.commit()
+            logging.info(f"🧹 补跑任务 {run_id} 完成：共处理 {run.processed} 个素材，{run.failed} 个仍为备用关键词")
+            return True
+
+        try:
+            skipped = self.handler(materials, run.model)
+            if skipped:
+                # 没有调用大模型：素材保持原样（不写备用关键词、不增加尝试次数），游标不前进
+                db.session.rollback()
+                logging.warning(f"补跑任务 {run_id}：豆包暂不可用，{len(skipped)} 个素材未分析，稍后重试这一批")
+                self._release(run_id)
+                return False
+            for material in materials:
+                material.sync_keyword_index()
+
+            run.cursor_time = materials[-1].upload_time
+            run.cursor_id = materials[-1].id
+            run.processed += len(materials)
+            run.failed += sum(1 for material in materials if material.ai_status == 'failed')
+            run.lease_until = None
+            run.updated_at = datetime.utcnow()
+            DataVersion.bump()
+            db.session.commit()
+        except Exception as e:
+            # 游标不前进，释放租约后下次重试这一批
+            db.session.rollback()
+            logging.error(f"补跑任务 {run_id} 处理失败: {e}")
+            self._release(run_id)
+        return True
+
+    def _release(self, run_id):
+        SweepRun.query.filter_by(id=run_id).update({'lease_until': None}, synchronize_session=False)
+        db.session.commit()
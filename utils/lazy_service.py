@@ -0,0 +1,102 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from config import Config
+from utils.metrics import metrics
+
+class LazyService:
+    """按需初始化的外部服务客户端（COS、豆包等）
+
+    首次使用时才调用 factory 创建实例（SDK 也在 factory 中导入），缩短进程启动时间。
+    初始化失败后每隔 SERVICE_RETRY_INTERVAL 秒重试，一次临时故障不会让服务永久不可用；
+    fork 出的子进程会重新创建自己的实例，不与父进程共用连接。
+    属性访问会转发给实例，布尔值表示服务当前是否可用。
+    """
+
+    def __init__(self, name, factory, retry_interval=None):
+        self.name = name
+        self.factory = factory
+        self.retry_interval = retry_interval if retry_interval is not None else Config.SERVICE_RETRY_INTERVAL
+
+        self._lock = threading.Lock()
+        self._instance = None
+        self._pid = None
+        self._error = None
+        self._failed_at = None
+        self._init_seconds = None
+        self._initialized_at = None
+        self._attempts = 0
+
+    def get(self):
+        """返回实例，不可用时返回 None"""
+        if self._instance is not None and self._pid == os.getpid():
+            return self._instance
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._instance is not None:
+                return self._instance
+            if self._failed_at is not None and time.monotonic() - self._failed_at < self.retry_interval:
+                return None
+
+            started = time.perf_counter()
+            self._attempts += 1
+            try:
+                instance = self.factory()
+            except Exception as e:
+                self._error = str(e)
+                self._failed_at = time.monotonic()
+                logging.error(f"❌ {self.name} 初始化失败（{self.retry_interval:.0f}s 后重试）: {e}")
+                return None
+
+            self._init_seconds = time.perf_counter() - started
+            self._initialized_at = datetime.now()
+            self._error = None
+            self._failed_at = None
+            self._instance = instance
+            metrics.observe('suyuan_stage_seconds', self._init_seconds, stage=f'init_{self.name}')
+            logging.info(f"✅ {self.name} 初始化完成，耗时 {self._init_seconds:.3f}s")
+            return instance
+
+    def peek(self):
+        """已初始化时返回实例，否则返回 None（不会触发初始化）"""
+        instance = self._instance
+        return instance if instance is not None and self._pid == os.getpid() else None
+
+    def available(self):
+        """不触发初始化的可用状态：已就绪为 True，最近一次初始化失败为 False，尚未初始化为 None"""
+        if self.peek() is not None:
+            return True
+        return False if self._error is not None and self._pid == os.getpid() else None
+
+    def state(self):
+        """初始化状态（不会触发初始化）"""
+        with self._lock:
+            return {
+                'ready': self._instance is not None and self._pid == os.getpid(),
+                'attempts': self._attempts,
+                'init_seconds': round(self._init_seconds, 3) if self._init_seconds is not None else None,
+                'initialized_at': self._initialized_at.isoformat() if self._initialized_at else None,
+                'error': self._error
+            }
+
+    def __bool__(self):
+        return self.get() is not None
+
+    def __getattr__(self, name):
+        instance = self.get()
+        if instance is None:
+            raise RuntimeError(f"{self.name} 不可用: {self._error}")
+        return getattr(instance, name)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._instance = None
+        self._error = None
+        self._failed_at = None
+        self._init_seconds = None
+        self._initialized_at = None
+        self._attempts = 0
@@ -0,0 +1,143 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# 耗时直方图的分桶上限（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class MetricsRegistry:
+    """进程内指标：直方图 + 计数器，按 Prometheus 文本格式输出
+
+    记录一次观测只需一次加锁和一次二分查找，可以放在热路径上。
+    gunicorn 多进程部署时每个 worker 各自统计，由 Prometheus 按实例汇总。
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}
+        self._histograms = {}  # (name, labels) -> [各桶计数..., 总和, 总数]
+        self._counters = {}    # (name, labels) -> 数值
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            values = self._histograms.get(key)
+            if values is None:
+                values = self._histograms[key] = [0] * (len(self.buckets) + 3)
+            values[index] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """统计代码块耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self, name):
+        """某个直方图各标签组合的 {'count', 'sum'}，供压测脚本汇总"""
+        with self._lock:
+            return {
+                ','.join(f'{key}={value}' for key, value in labels): {'count': values[-1], 'sum': values[-2]}
+                for (metric, labels), values in self._histograms.items() if metric == name
+            }
+
+    def render(self):
+        """Prometheus 文本格式"""
+        with self._lock:
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        described = set()
+
+        def header(name, metric_type):
+            if name in described:
+                return
+            described.add(name)
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, labels), values in sorted(histograms.items()):
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+def instrument_sqlalchemy(registry):
+    """通过 SQLAlchemy 事件统计 SQL 执行和事务提交耗时（对所有引擎和会话生效）"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.orm import Session
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('metrics_started')
+        if started:
+            registry.observe('suyuan_stage_seconds', time.perf_counter() - started.pop(), stage='db_query')
+
+    @event.listens_for(Engine, 'handle_error')
+    def _execute_failed(context):
+        started = context.connection.info.get('metrics_started') if context.connection else None
+        if started:
+            started.pop()
+
+    # before_commit 在 flush 之前触发，统计结果包含 flush 和 COMMIT
+    @event.listens_for(Session, 'before_commit')
+    def _before_commit(session):
+        session.info['metrics_commit_started'] = time.perf_counter()
+
+    @event.listens_for(Session, 'after_commit')
+    def _after_commit(session):
+        started = session.info.pop('metrics_commit_started', None)
+        if started is not None:
+            registry.observe('suyuan_stage_seconds', time.perf_counter() - started, stage='db_commit')
+
+    @event.listens_for(Session, 'after_rollback')
+    def _after_rollback(session):
+        session.info.pop('metrics_commit_started', None)
+
+
+metrics = MetricsRegistry()
+metrics.describe('suyuan_stage_seconds', '各处理阶段耗时（COS、大模型、数据库、序列化等）')
+metrics.describe('suyuan_request_seconds', '接口请求耗时')
+metrics.describe('suyuan_ai_results_total', '关键词生成结果（success / fallback / cached）')
+metrics.describe('suyuan_cache_requests_total', '缓存命中情况')
+metrics.describe('suyuan_derivative_failures_total', '图片衍生文件生成失败（broken_pool / timeout / error）')
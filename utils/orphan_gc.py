@@ -0,0 +1,160 @@
+import time
+import heapq
+import logging
+import tempfile
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from models import db, Material
+from config import Config
+from utils.metrics import metrics
+
+# 素材表中引用 COS 对象的列（原文件及衍生文件）
+REFERENCE_COLUMNS = (Material.file_path, Material.analysis_url, Material.thumbnail_url, Material.web_url)
+
+# COS 批量删除接口每次最多 1000 个对象
+DELETE_BATCH_SIZE = 1000
+
+# 报告中保留的对象键样例数
+SAMPLE_SIZE = 20
+
+class OrphanCollector:
+    """COS 孤儿对象清理：找出桶中已没有素材记录引用的对象并批量删除
+
+    素材表按 id 分批读取引用的对象键，每 chunk_size 个排序后写入临时文件，再用 heapq.merge
+    归并成有序、去重的键流（外部排序，内存只保留一个分块）；COS 列表接口本身按对象键顺序分页返回，
+    两条有序流做归并比较即可找出孤儿对象，不需要把桶或素材表整个加载到内存。
+    最后修改时间在宽限期内的对象不删除（客户端直传后尚未调用 complete、上传中途等情况），
+    每批删除前再检查一次扫描开始后新写入的素材记录，避免误删刚被引用的对象。
+    """
+
+    def __init__(self, storage, object_key, prefix='materials/', grace_seconds=None, chunk_size=None):
+        self.storage = storage
+        self.object_key = object_key
+        self.prefix = prefix
+        self.grace_seconds = grace_seconds if grace_seconds is not None else Config.ORPHAN_GC_GRACE_HOURS * 3600
+        self.chunk_size = chunk_size or Config.ORPHAN_GC_CHUNK_SIZE
+
+    def run(self, dry_run=False, progress=None):
+        """执行一次清理并返回报告；dry_run 时只统计不删除，progress(report) 用于输出进度"""
+        started = time.perf_counter()
+        snapshot = datetime.utcnow()
+        cutoff = snapshot - timedelta(seconds=self.grace_seconds)
+        report = {
+            'dry_run': dry_run,
+            'prefix': self.prefix,
+            'grace_seconds': self.grace_seconds,
+            'scanned_objects': 0,
+            'scanned_bytes': 0,
+            'referenced': 0,
+            'orphans': 0,
+            'orphan_bytes': 0,
+            'skipped_recent': 0,
+            'rescued': 0,
+            'deleted': 0,
+            'failed': 0,
+            'failed_sample': [],
+            'orphan_sample': []
+        }
+        pending = []
+
+        with ExitStack() as stack:
+            referenced = self._referenced_keys(stack)
+            # 取第一个键时素材表已扫描完（分块已落盘），列出 COS 期间不占用数据库连接
+            reference = next(referenced, None)
+            db.session.close()
+
+            for item in self.storage.list_objects(self.prefix):
+                key = item['key']
+                if key.endswith('/'):
+                    continue  # 目录占位对象
+                report['scanned_objects'] += 1
+                report['scanned_bytes'] += item['size']
+
+                while reference is not None and reference < key:
+                    reference = next(referenced, None)
+                if reference == key:
+                    report['referenced'] += 1
+                elif item['last_modified'] > cutoff:
+                    report['skipped_recent'] += 1
+                else:
+                    report['orphans'] += 1
+                    report['orphan_bytes'] += item['size']
+                    if len(report['orphan_sample']) < SAMPLE_SIZE:
+                        report['orphan_sample'].append(key)
+                    pending.append(key)
+                    if len(pending) >= DELETE_BATCH_SIZE:
+                        self._delete(pending, snapshot, dry_run, report)
+                        pending = []
+
+                if progress and report['scanned_objects'] % 10000 == 0:
+                    progress(report)
+
+        if pending:
+            self._delete(pending, snapshot, dry_run, report)
+
+        report['seconds'] = round(time.perf_counter() - started, 3)
+        metrics.observe('suyuan_stage_seconds', report['seconds'], stage='orphan_gc')
+        logging.info(f"🗑️ 孤儿对象清理完成: 扫描 {report['scanned_objects']} 个对象，"
+                     f"孤儿 {report['orphans']} 个，删除 {report['deleted']} 个，失败 {report['failed']} 个")
+        return report
+
+    def _referenced_keys(self, stack):
+        """素材表引用的全部对象键（有序、去重的迭代器），分块排序后经临时文件归并"""
+        runs = []
+        chunk = []
+        last_id = ''
+        while True:
+            rows = db.session.execute(
+                select(Material.id, *REFERENCE_COLUMNS)
+                .where(Material.id > last_id)
+                .order_by(Material.id)
+                .limit(Config.DELETE_CHUNK_SIZE)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            for row in rows:
+                chunk.extend(self.object_key(url) for url in row[1:] if url)
+            if len(chunk) >= self.chunk_size:
+                runs.append(self._spill(sorted(chunk), stack))
+                chunk = []
+
+        runs.append(iter(sorted(chunk)))
+        previous = None
+        for key in heapq.merge(*runs):
+            if key != previous:
+                yield key
+                previous = key
+
+    @staticmethod
+    def _spill(keys, stack):
+        """把一个已排序的分块写入临时文件，返回逐行读取的迭代器"""
+        run = stack.enter_context(tempfile.TemporaryFile(mode='w+', encoding='utf-8'))
+        run.writelines(f"{key}\n" for key in keys)
+        run.seek(0)
+        return (line.rstrip('\n') for line in run)
+
+    def _recently_referenced(self, snapshot):
+        """扫描开始后新写入的素材记录引用的对象键（按 upload_time 索引查询）"""
+        rows = db.session.execute(
+            select(*REFERENCE_COLUMNS).where(Material.upload_time >= snapshot)
+        ).all()
+        db.session.close()
+        return {self.object_key(url) for row in rows for url in row if url}
+
+    def _delete(self, keys, snapshot, dry_run, report):
+        recent = self._recently_referenced(snapshot)
+        if recent:
+            remaining = [key for key in keys if key not in recent]
+            report['rescued'] += len(keys) - len(remaining)
+            keys = remaining
+        if dry_run or not keys:
+            return
+
+        result = self.storage.delete_files(keys)
+        report['deleted'] += result['deleted']
+        report['failed'] += len(result['failed'])
+        room = SAMPLE_SIZE - len(report['failed_sample'])
+        if room > 0:
+            report['failed_sample'].extend(result['failed'][:room])
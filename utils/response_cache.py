@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response, Response
+from config import Config
+from utils.metrics import metrics
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+class ResponseCache:
+    """读接口的响应缓存
+
+    每个响应的 ETag 由“数据版本号 + 请求路径和参数”决定：客户端带 If-None-Match
+    且版本未变时直接返回 304，不查询数据库也不序列化；否则优先使用缓存的响应体。
+    进程内缓存按条数和总字节数淘汰，配置 RESPONSE_CACHE_REDIS_URL 后改用 Redis 在
+    多个 worker 间共享。
+    """
+
+    def __init__(self, version_getter, max_entries=None, max_bytes=None, redis_url=None):
+        self.version_getter = version_getter
+        self.max_entries = max_entries or Config.RESPONSE_CACHE_SIZE
+        self.max_bytes = max_bytes or Config.RESPONSE_CACHE_MAX_BYTES
+        self.ttl = Config.RESPONSE_CACHE_TTL
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> body
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+        redis_url = redis_url or Config.RESPONSE_CACHE_REDIS_URL
+        self._redis = None
+        if redis_url:
+            if redis is None:
+                logging.warning("未安装 redis，响应缓存使用进程内存")
+            else:
+                self._redis = redis.Redis.from_url(redis_url)
+
+    def cached(self, view):
+        """装饰读接口：处理 ETag / Last-Modified，并缓存 200 响应体"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version, updated_at = self.version_getter()
+            path = request.full_path
+            etag = hashlib.sha1(f"{version}:{path}".encode('utf-8')).hexdigest()
+
+            # Last-Modified 只有秒级精度，同一秒内的多次变更无法区分，因此只按 ETag 判断
+            if request.if_none_match.contains(etag):
+                with self._lock:
+                    self.not_modified += 1
+                metrics.inc('suyuan_cache_requests_total', cache='response', result='not_modified')
+                return self._with_validators(Response(status=304), etag, updated_at)
+
+            key = f"response:{etag}"
+            body = self._get(key)
+            if body is not None:
+                response = Response(body, mimetype='application/json')
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                # 流式响应不缓存响应体，只附带校验头
+                if not response.is_streamed:
+                    self._set(key, response.get_data())
+
+            return self._with_validators(response, etag, updated_at)
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'redis' if self._redis else 'memory',
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified
+            }
+
+    def _with_validators(self, response, etag, updated_at):
+        response.set_etag(etag)
+        if updated_at:
+            response.last_modified = updated_at
+        # 允许客户端缓存，但每次使用前必须重新校验
+        response.cache_control.no_cache = True
+        return response
+
+    def _get(self, key):
+        if self._redis:
+            try:
+                body = self._redis.get(key)
+            except Exception as e:
+                logging.warning(f"响应缓存读取失败: {e}")
+                body = None
+        else:
+            with self._lock:
+                body = self._entries.get(key)
+                if body is not None:
+                    self._entries.move_to_end(key)
+
+        with self._lock:
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.inc('suyuan_cache_requests_total', cache='response', result='miss' if body is None else 'hit')
+        return body
+
+    def _set(self, key, body):
+        if self._redis:
+            try:
+                self._redis.set(key, body, ex=self.ttl)
+            except Exception as e:
+                logging.warning(f"响应缓存写入失败: {e}")
+            return
+
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = body
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
@@ -0,0 +1,76 @@
+import re
+import time
+import logging
+import shutil
+import subprocess
+from config import Config
+
+DURATION_PATTERN = re.compile(r'Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)')
+
+def probe_duration(source, timeout=None):
+    """读取视频时长（秒），无法获取时返回 None"""
+    try:
+        result = subprocess.run(
+            [Config.FFMPEG_BIN, '-hide_banner', '-i', source],
+            capture_output=True,
+            timeout=timeout or Config.VIDEO_KEYFRAME_TIMEOUT
+        )
+    except Exception as e:
+        logging.error(f"读取视频时长失败: {e}")
+        return None
+
+    # 不指定输出时 ffmpeg 以错误码退出，时长信息在 stderr 中
+    match = DURATION_PATTERN.search(result.stderr.decode('utf-8', 'ignore'))
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def sample_keyframes(source, max_frames=None, max_side=None, timeout=None):
+    """从视频（本地路径或URL）中均匀抽取关键帧，返回缩小后的 JPEG 字节列表
+
+    每帧单独用 -ss 定位到最近的关键帧再解码一帧，耗时只取决于帧数，
+    与视频长度无关。探测时长和各帧共用 timeout 秒（默认 VIDEO_KEYFRAME_TIMEOUT）的总时限，
+    每次调用只能用剩余的时间，用完后不再抽取剩下的帧，返回已抽到的部分。
+    未安装 ffmpeg 或抽帧失败时返回空列表。
+    """
+    max_frames = max_frames or Config.VIDEO_KEYFRAME_COUNT
+    max_side = max_side or Config.VIDEO_KEYFRAME_MAX_SIDE
+    deadline = time.monotonic() + (timeout or Config.VIDEO_KEYFRAME_TIMEOUT)
+
+    if not shutil.which(Config.FFMPEG_BIN):
+        logging.warning("未找到 ffmpeg，跳过视频抽帧")
+        return []
+
+    duration = probe_duration(source, timeout=deadline - time.monotonic())
+    if not duration:
+        return []
+
+    scale = f"scale='min({max_side},iw)':'min({max_side},ih)':force_original_aspect_ratio=decrease"
+    frames = []
+    for i in range(max_frames):
+        # 取每段的中点，避开片头片尾的黑场
+        timestamp = duration * (i + 0.5) / max_frames
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            logging.warning(f"视频抽帧超过总时限，跳过剩余 {max_frames - i} 帧")
+            break
+        try:
+            result = subprocess.run(
+                [
+                    Config.FFMPEG_BIN, '-hide_banner', '-loglevel', 'error',
+                    '-ss', f'{timestamp:.3f}', '-i', source,
+                    '-frames:v', '1', '-vf', scale,
+                    '-f', 'image2pipe', '-vcodec', 'mjpeg', '-q:v', '5', '-'
+                ],
+                capture_output=True,
+                timeout=remaining
+            )
+        except Exception as e:
+            logging.error(f"视频抽帧失败（{timestamp:.1f}s）: {e}")
+            continue
+        if result.returncode == 0 and result.stdout:
+            frames.append(result.stdout)
+
+    logging.info(f"🎞️ 视频抽帧完成: {len(frames)}/{max_frames} 帧，时长 {duration:.1f}s")
+    return frames
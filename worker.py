@@ -0,0 +1,11 @@
+# 独立的关键词生成 worker 进程（同时负责关键词补跑）
+# 用法：AI_ASYNC_MODE=true AI_EMBEDDED_WORKERS=false python worker.py
+from app import app, job_queue, keyword_sweeper
+from models import db
+
+if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
+    keyword_sweeper.ensure_started()
+    print(f"🚀 关键词生成 worker 已启动（{job_queue.workers} 个线程）")
+    job_queue.run_forever()